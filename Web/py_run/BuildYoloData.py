@@ -7,6 +7,8 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
+from yolo_dataset import (MATERIALIZE_MODES, materialize_pairs, write_path_list, write_data_yaml,
+                          read_class_names, collect_pairs, guess_sub_dirs)
 
 class YoloSplitterApp(ttk.Window):
     def __init__(self):
@@ -23,6 +25,8 @@ class YoloSplitterApp(ttk.Window):
         self.target_dir = tk.StringVar()
         self.split_ratio = tk.DoubleVar(value=80.0)
         self.allow_overlap = tk.BooleanVar(value=False)
+        self.materialize_mode = tk.StringVar(value="复制 (copy)")
+        self.copy_workers = tk.IntVar(value=8)
         self.is_running = False
         
         self.create_ui()
@@ -70,6 +74,13 @@ class YoloSplitterApp(ttk.Window):
         ttk.Scale(param_frame, from_=10, to=90, variable=self.split_ratio, command=self.update_ratio_label, bootstyle=INFO).pack(fill=X, pady=10)
         ttk.Checkbutton(param_frame, text="允许训练集与验证集数据重复 (数据泄露模式)", variable=self.allow_overlap, bootstyle="round-toggle").pack(anchor=W)
 
+        mode_row = ttk.Frame(param_frame)
+        mode_row.pack(fill=X, pady=(10, 0))
+        ttk.Label(mode_row, text="输出方式:", width=12).pack(side=LEFT)
+        ttk.Combobox(mode_row, textvariable=self.materialize_mode, values=list(MATERIALIZE_MODES.keys()), state="readonly").pack(side=LEFT, padx=5, fill=X, expand=YES)
+        ttk.Label(mode_row, text="复制线程:").pack(side=LEFT, padx=(10, 0))
+        ttk.Spinbox(mode_row, from_=1, to=64, textvariable=self.copy_workers, width=5).pack(side=LEFT, padx=5)
+
         # --- 4. 运行与进度 ---
         btn_frame = ttk.Frame(main_frame)
         btn_frame.pack(fill=X, pady=15)
@@ -98,13 +109,9 @@ class YoloSplitterApp(ttk.Window):
         if path:
             abs_path = os.path.abspath(path)
             self.source_dir.set(abs_path)
-            for item in os.listdir(abs_path):
-                full_item = os.path.join(abs_path, item)
-                if os.path.isdir(full_item):
-                    if item.lower() in ["images", "image", "frames", "frame"]:
-                        self.image_dir.set(full_item)
-                    elif item.lower() in ["labels", "label"]:
-                        self.label_dir.set(full_item)
+            image_dir, label_dir = guess_sub_dirs(abs_path)
+            if image_dir: self.image_dir.set(image_dir)
+            if label_dir: self.label_dir.set(label_dir)
 
     def select_target(self):
         path = filedialog.askdirectory()
@@ -155,51 +162,13 @@ class YoloSplitterApp(ttk.Window):
             target_path_obj = Path(target_path)
             
             # --- 读取 classes.txt ---
-            class_names = []
-            found_classes = list(source_path_obj.rglob('classes.txt'))
-            if found_classes:
-                p = found_classes[0]
-                content = None
-                for enc in ['utf-8', 'gbk', 'gb2312', 'latin1']:
-                    try:
-                        with open(p, 'r', encoding=enc) as f:
-                            content = f.readlines()
-                        self.log(f"📖 成功以 {enc} 编码读取 classes.txt")
-                        break
-                    except Exception:
-                        continue
-                
-                if content:
-                    class_names = [line.strip() for line in content if line.strip()]
-
-            # 递归匹配
-            image_extensions = {'.jpg', '.jpeg', '.png', '.bmp'}
-            valid_pairs = []
-            
+            class_names = read_class_names(source_path_obj, self.log, (self.label_dir.get(), self.image_dir.get()))
+
+            # 递归匹配（并行 scandir，直接剪掉输出目录 bvn）
             self.log("🔎 开始扫描指定目录文件...")
             forbidden_path = target_path_obj / "bvn"
-
-            img_path_obj = Path(self.image_dir.get())
-            lbl_path_obj = Path(self.label_dir.get())
-            file_map = {}
-
-            # 扫描图片
-            for f in img_path_obj.rglob('*'):
-                if not f.is_file(): continue
-                if forbidden_path in f.parents: continue
-                if f.suffix.lower() in image_extensions:
-                    file_map.setdefault(f.stem, {})['img'] = f
-
-            # 扫描标签
-            for f in lbl_path_obj.rglob('*'):
-                if not f.is_file(): continue
-                if forbidden_path in f.parents: continue
-                if f.suffix.lower() == '.txt' and f.name != 'classes.txt':
-                    file_map.setdefault(f.stem, {})['txt'] = f
-            
-            for stem, paths in file_map.items():
-                if 'img' in paths and 'txt' in paths:
-                    valid_pairs.append((paths['img'], paths['txt']))
+            pairs = collect_pairs(self.image_dir.get(), self.label_dir.get(), forbidden_path)
+            valid_pairs = [(Path(p['img'][0]), Path(p['txt'][0])) for p in pairs.values()]
 
             total_pairs = len(valid_pairs)
             if total_pairs == 0:
@@ -215,36 +184,44 @@ class YoloSplitterApp(ttk.Window):
             val_set = random.sample(valid_pairs, k=max(1, total_pairs-split_idx)) if self.allow_overlap.get() else valid_pairs[split_idx:]
 
             # 创建目录
+            mode = MATERIALIZE_MODES.get(self.materialize_mode.get(), "copy")
             base_dir = target_path_obj.absolute() / "bvn"
-            dirs = {'it': base_dir/"images"/"train", 'iv': base_dir/"images"/"val",
-                    'lt': base_dir/"labels"/"train", 'lv': base_dir/"labels"/"val"}
-            
             if base_dir.exists(): shutil.rmtree(base_dir)
-            for d in dirs.values(): d.mkdir(parents=True, exist_ok=True)
 
-            # 复制文件
-            self.log(f"🚚 准备复制 {len(train_set) + len(val_set)} 对文件...")
-            total_ops = len(train_set) + len(val_set)
-            self.curr_count = 0
-            
-            def copy_logic(dataset, img_d, lbl_d):
-                for img_s, txt_s in dataset:
-                    shutil.copy2(img_s, img_d / img_s.name)
-                    shutil.copy2(txt_s, lbl_d / txt_s.name)
-                    self.curr_count += 1
-                    if self.curr_count % 5 == 0:
-                        prog = (self.curr_count / total_ops) * 100
+            if mode == "list":
+                # 不复制任何文件，只写路径列表
+                base_dir.mkdir(parents=True, exist_ok=True)
+                mismatched = write_path_list(train_set, base_dir / "train.txt")
+                mismatched += write_path_list(val_set, base_dir / "val.txt")
+                if mismatched:
+                    self.log(f"⚠️ 有 {mismatched} 个标签不在与图片对应的 labels 目录中，Ultralytics 将找不到它们，请改用链接模式。")
+                train_ref, val_ref = "train.txt", "val.txt"
+            else:
+                dirs = {'it': base_dir/"images"/"train", 'iv': base_dir/"images"/"val",
+                        'lt': base_dir/"labels"/"train", 'lv': base_dir/"labels"/"val"}
+                for d in dirs.values(): d.mkdir(parents=True, exist_ok=True)
+
+                total_ops = len(train_set) + len(val_set)
+                self.log(f"🚚 准备以 {mode} 方式输出 {total_ops} 对文件...")
+                self.curr_count = 0
+                count_lock = threading.Lock()
+
+                def on_done():
+                    with count_lock:
+                        self.curr_count += 1
+                        curr = self.curr_count
+                    if curr % 50 == 0 or curr == total_ops:
+                        prog = (curr / total_ops) * 100
                         self.after(0, lambda v=prog: self.progress.configure(value=v))
 
-            copy_logic(train_set, dirs['it'], dirs['lt'])
-            copy_logic(val_set, dirs['iv'], dirs['lv'])
+                # 链接只是元数据操作，多线程意义不大；真正复制时才开多线程
+                workers = max(1, int(self.copy_workers.get())) if mode in ("copy", "reflink") else 1
+                materialize_pairs(train_set, dirs['it'], dirs['lt'], mode, workers, on_done)
+                materialize_pairs(val_set, dirs['iv'], dirs['lv'], mode, workers, on_done)
+                train_ref, val_ref = "images/train", "images/val"
 
             # 生成 YAML
-            yaml_path = base_dir / "data.yaml"
-            names_str = "\n".join([f"  {i}: {n}" for i, n in enumerate(class_names)]) if class_names else "  0: object"
-            yaml_content = f"path: {base_dir.as_posix()}\ntrain: images/train\nval: images/val\n\nnames:\n{names_str}"
-            with open(yaml_path, "w", encoding="utf-8") as f:
-                f.write(yaml_content)
+            write_data_yaml(base_dir, class_names, train_ref, val_ref)
 
             self.log(f"✨ 任务成功完成！")
             self.after(0, lambda: messagebox.showinfo("成功", f"数据集已生成在:\n{base_dir}"))
@@ -0,0 +1,55 @@
+"""
+自适应时间采样：先打稀疏关键帧，再只在相邻结果不一致的区间里二分加密
+
+帧位置统一用“抽帧网格”的下标表示（网格即按 frameRate 固定步长抽出的帧），
+因此最小间隔不会小于 1/frameRate，所有选中的帧仍然是固定模式下会抽到的帧，缓存可以互通。
+"""
+import numpy as np
+
+def box_iou(a, b):
+    """两个 [ymin,xmin,ymax,xmax] 框的 IoU"""
+    ih = min(a[2], b[2]) - max(a[0], b[0])
+    iw = min(a[3], b[3]) - max(a[1], b[1])
+    if ih <= 0 or iw <= 0: return 0.0
+    inter = ih * iw
+    union = (a[2]-a[0]) * (a[3]-a[1]) + (b[2]-b[0]) * (b[3]-b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def results_differ(labels_a, boxes_a, labels_b, boxes_b, iou_threshold=0.5):
+    """判断两帧结果是否“有变化”：数量不同、标签不同，或同标签贪心匹配后有框的 IoU 低于阈值"""
+    if len(labels_a) != len(labels_b): return True
+    if sorted(labels_a) != sorted(labels_b): return True
+    used = set()
+    for la, ba in zip(labels_a, boxes_a):
+        best, best_j = -1.0, None
+        for j, (lb, bb) in enumerate(zip(labels_b, boxes_b)):
+            if j in used or lb != la: continue
+            iou = box_iou(ba, bb)
+            if iou > best: best, best_j = iou, j
+        if best_j is None or best < iou_threshold: return True
+        used.add(best_j)
+    return False
+
+def keyframe_positions(grid_len, keyframe_every):
+    """稀疏关键帧网格，总是包含最后一帧，保证整段视频都被区间覆盖"""
+    if grid_len <= 0: return []
+    positions = list(range(0, grid_len, max(1, keyframe_every)))
+    if positions[-1] != grid_len - 1: positions.append(grid_len - 1)
+    return positions
+
+def refine_candidates(tagged_positions, differ, min_gap=1, skip=()):
+    """对相邻已打标位置 (p, q)：间隔大于 min_gap 且结果不同，则选中点 (p+q)//2
+    返回按区间长度从大到小排列的中点（预算不足时优先加密最长的变化区间）"""
+    candidates = []
+    for p, q in zip(tagged_positions, tagged_positions[1:]):
+        if q - p <= min_gap: continue
+        m = (p + q) // 2
+        if m in skip: continue
+        if differ(p, q): candidates.append((q - p, m))
+    candidates.sort(key=lambda x: (-x[0], x[1]))
+    return [m for _, m in candidates]
+
+def frame_signature(store, time_sec, tol):
+    """从 AnnotationStore 中取出某一帧的 (标签 id 列表, 框列表)"""
+    sl = store.near(time_sec, tol)
+    return store.label_ids[sl].tolist(), np.asarray(store.boxes[sl], dtype=np.float64).tolist()
@@ -0,0 +1,140 @@
+"""
+视频标注的紧凑列式存储
+
+每条标注在内存中只占 float32 时间 + int16x4 坐标 + int32 标签号，标签字符串统一驻留在 LabelTable 中。
+只有在写缓存 JSON / 导出时才转换回 {'label', 'box_2d', 'time'} 字典。
+"""
+import threading
+import numpy as np
+
+class LabelTable:
+    """标签字符串驻留表：label <-> 整数 id（线程安全，可在多个视频间共享）"""
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self.lock = threading.Lock()
+
+    def intern(self, name):
+        with self.lock:
+            if name not in self.ids:
+                self.ids[name] = len(self.names)
+                self.names.append(name)
+            return self.ids[name]
+
+    def name(self, label_id):
+        return self.names[label_id]
+
+def _valid_box(box):
+    if not isinstance(box, (list, tuple)) or len(box) < 4: return None
+    try:
+        return [int(round(float(v))) for v in box[:4]]
+    except (TypeError, ValueError):
+        return None
+
+class AnnotationStore:
+    """按时间排列的检测框数组，支持 O(1) 均摊追加、排序和按时间区间二分切片
+    另外记录每个已处理（调用过 API）的时间点，空结果也算，用于断点续传"""
+    def __init__(self, labels=None, capacity=256):
+        self.labels = labels if labels is not None else LabelTable()
+        self._times = np.empty(capacity, dtype=np.float32)
+        self._boxes = np.empty((capacity, 4), dtype=np.int16)
+        self._label_ids = np.empty(capacity, dtype=np.int32)
+        self._size = 0
+        self._sorted = True
+        self._processed = {}  # round(t, 2) -> 原始时间
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def times(self): return self._times[:self._size]
+
+    @property
+    def boxes(self): return self._boxes[:self._size]
+
+    @property
+    def label_ids(self): return self._label_ids[:self._size]
+
+    def _reserve(self, n):
+        cap = len(self._times)
+        if self._size + n <= cap: return
+        new_cap = max(cap * 2, self._size + n)
+        for attr in ('_times', '_boxes', '_label_ids'):
+            old = getattr(self, attr)
+            new = np.empty((new_cap,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, attr, new)
+
+    def append(self, time_sec, label, box):
+        box = _valid_box(box)
+        if box is None: return False
+        self._reserve(1)
+        i = self._size
+        if i and time_sec < self._times[i - 1]: self._sorted = False
+        self._times[i] = time_sec
+        self._boxes[i] = np.clip(box, -32768, 32767)
+        self._label_ids[i] = self.labels.intern(label)
+        self._size += 1
+        return True
+
+    def mark_processed(self, time_sec):
+        self._processed.setdefault(round(time_sec, 2), time_sec)
+
+    def is_processed(self, time_sec):
+        return round(time_sec, 2) in self._processed
+
+    @property
+    def processed_times(self):
+        return sorted(self._processed.values())
+
+    def add_result(self, time_sec, items, default_label='object'):
+        """记录一次 API 结果（可为空），返回实际存入的框数"""
+        self.mark_processed(time_sec)
+        added = 0
+        for item in items or []:
+            if isinstance(item, dict) and self.append(time_sec, item.get('label', default_label), item.get('box_2d')):
+                added += 1
+        return added
+
+    def sort(self):
+        if self._sorted: return
+        order = np.argsort(self.times, kind='stable')
+        self._times[:self._size] = self.times[order]
+        self._boxes[:self._size] = self.boxes[order]
+        self._label_ids[:self._size] = self.label_ids[order]
+        self._sorted = True
+
+    def time_range(self, t0, t1):
+        """[t0, t1) 区间内的标注切片"""
+        self.sort()
+        times = self.times
+        return slice(int(np.searchsorted(times, t0, 'left')), int(np.searchsorted(times, t1, 'left')))
+
+    def near(self, time_sec, tol):
+        """|time - time_sec| < tol 的标注切片（与导出时按帧匹配的规则一致）"""
+        self.sort()
+        times = self.times
+        return slice(int(np.searchsorted(times, time_sec - tol, 'right')), int(np.searchsorted(times, time_sec + tol, 'left')))
+
+    def to_dicts(self, sl=slice(None), include_checked=False):
+        """转换为 [{'label', 'box_2d', 'time'}]；include_checked 时补上空结果的 _checked 标记（写缓存用）"""
+        times = self.times[sl].tolist()
+        boxes = self.boxes[sl].tolist()
+        names = self.labels.names
+        out = [{'label': names[lid], 'box_2d': box, 'time': round(t, 6)}
+               for t, box, lid in zip(times, boxes, self.label_ids[sl].tolist())]
+        if include_checked:
+            with_boxes = {round(t, 2) for t in self.times.tolist()}
+            out.extend({'time': t, '_checked': True} for key, t in self._processed.items() if key not in with_boxes)
+        return out
+
+    @classmethod
+    def from_dicts(cls, dicts, labels=None, default_label='object'):
+        store = cls(labels, capacity=max(256, len(dicts)))
+        for item in dicts:
+            t = item.get('time', -1)
+            if t is None or t < 0: continue
+            store.mark_processed(t)
+            if not item.get('_checked'):
+                store.append(t, item.get('label', default_label), item.get('box_2d'))
+        return store
@@ -0,0 +1,96 @@
+"""
+检查脚本共用的工具：合成任务包、本地假 API、在子进程中运行 runner
+
+假 API 在图中查找绿色方块并返回每个方块的框，调用次数写入 calls.log（每次调用一行，便于多进程统计）。
+运行时直接设置 main.CONFIGS，不读取真实的 config.js。
+"""
+import base64
+import json
+import os
+import sys
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+
+PY_RUN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PY_RUN_DIR not in sys.path: sys.path.insert(0, PY_RUN_DIR)
+
+def make_video(path, frames=90, size=(160, 120), fps=30):
+    w, h = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    for i in range(frames):
+        img = np.zeros((h, w, 3), np.uint8)
+        x = i % (w - 30)
+        cv2.rectangle(img, (x, 20), (x + 30, 60), (0, 255, 0), -1)
+        writer.write(img)
+    writer.release()
+
+def make_image(path, i):
+    img = np.full((120, 160, 3), 40, np.uint8)
+    cv2.rectangle(img, (10 + i * 5, 20), (60 + i * 5, 70), (0, 255, 0), -1)
+    cv2.imwrite(path, img)
+
+def make_task(zip_path, mode, n_files, config=None):
+    """生成与网页导出结构一致的任务包：task/task_config.json + task/files/*"""
+    cfg = {"mode": mode, "model": "fake", "prompt": "box", "classLabel": "box", "apiRpm": 6000,
+           "parallelCount": 4, "frameRate": "5", "exportOptions": ["yolo_txt", "classes_txt"]}
+    cfg.update(config or {})
+    tmp_dir = os.path.dirname(os.path.abspath(zip_path))
+    with zipfile.ZipFile(zip_path, 'w') as zf:
+        zf.writestr('task/task_config.json', json.dumps(cfg))
+        for i in range(n_files):
+            name = f"vid{i}.mp4" if mode == 'video' else f"img{i}.jpg"
+            path = os.path.join(tmp_dir, name)
+            if mode == 'video': make_video(path)
+            else: make_image(path, i)
+            zf.write(path, 'task/files/' + name)
+            os.remove(path)
+
+class FakeApi:
+    def __init__(self, calls_log, delay=0.0):
+        calls_log = self.calls_log = os.path.abspath(calls_log)
+        lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                url = body['messages'][0]['content'][1]['image_url']['url']
+                img = cv2.imdecode(np.frombuffer(base64.b64decode(url.split(',', 1)[1]), np.uint8), 1)
+                h, w = img.shape[:2]
+                mask = (img[:, :, 1] > 150) & (img[:, :, 2] < 100)
+                # 每个连通的绿色块一个框
+                n, _, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8))
+                objs = [{"label": "box", "box_2d": [int(y / h * 1000), int(x / w * 1000), int((y + bh - 1) / h * 1000), int((x + bw - 1) / w * 1000)]}
+                        for x, y, bw, bh, area in stats[1:] if area >= 20]
+                if delay: threading.Event().wait(delay)
+                with lock:
+                    with open(calls_log, 'a') as f: f.write(f"{os.getpid()}\n")
+                out = json.dumps({"choices": [{"message": {"content": json.dumps(objs)}}]}).encode()
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Length', str(len(out)))
+                    self.end_headers()
+                    self.wfile.write(out)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # 调用方已被 kill
+
+            def log_message(self, *args): pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+def count_calls(calls_log):
+    if not os.path.exists(calls_log): return 0
+    with open(calls_log) as f: return sum(1 for _ in f)
+
+def use_fake_api(url):
+    import main
+    main.CONFIGS.clear()
+    main.CONFIGS['fake'] = {"url": url, "key": "sk-check", "model": "fake"}
+    return main
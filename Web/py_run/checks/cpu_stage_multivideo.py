@@ -0,0 +1,63 @@
+"""
+回归检查：多视频 + CPU 进程池（预抽帧线程与子进程编码同时工作）不能卡死
+
+用法: python checks/cpu_stage_multivideo.py [--runs 6] [--videos 3] [--cpu-workers 4] [--timeout 120]
+每轮在子进程中完整跑一个任务，超时即判定为卡死；结束后检查 /dev/shm 中没有遗留的共享内存块。
+"""
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+from _fixtures import FakeApi, make_task, use_fake_api
+
+def run_once(work_dir, url, cpu_workers):
+    main = use_fake_api(url)
+    zip_path = os.path.join(work_dir, "multi.zip")
+    ok = main.AutoTagRunner(zip_path, cpu_workers=cpu_workers).run()
+    sys.exit(0 if ok else 1)
+
+def shm_blocks():
+    return set(glob.glob("/dev/shm/psm_*"))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=6)
+    parser.add_argument('--videos', type=int, default=3)
+    parser.add_argument('--cpu-workers', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--once', nargs=2, metavar=('WORK_DIR', 'URL'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.once: return run_once(args.once[0], args.once[1], args.cpu_workers)
+
+    failures = 0
+    shm_before = shm_blocks()
+    with tempfile.TemporaryDirectory() as tmp:
+        api = FakeApi(os.path.join(tmp, "calls.log"))
+        for run in range(args.runs):
+            work_dir = os.path.join(tmp, f"run{run}")
+            os.makedirs(work_dir)
+            make_task(os.path.join(work_dir, "multi.zip"), 'video', args.videos, {"exportOptions": ["yolo_txt", "frames"]})
+            cmd = [sys.executable, os.path.abspath(__file__), '--cpu-workers', str(args.cpu_workers), '--once', work_dir, api.url]
+            try:
+                result = subprocess.run(cmd, timeout=args.timeout, capture_output=True, text=True)
+                status = "ok" if result.returncode == 0 else f"failed (exit {result.returncode})"
+                if result.returncode != 0:
+                    failures += 1
+                    print(result.stdout[-2000:], result.stderr[-2000:])
+            except subprocess.TimeoutExpired:
+                failures += 1
+                status = f"HUNG (> {args.timeout:g}s)"
+            labels = len(glob.glob(os.path.join(work_dir, "Result", "multi", "labels", "*.txt")))
+            print(f"run {run + 1}/{args.runs}: {status}, {labels} label files")
+        api.close()
+    leaked = shm_blocks() - shm_before
+    if leaked:
+        failures += 1
+        print(f"Leaked shared memory blocks: {sorted(leaked)}")
+    print("PASS" if not failures else f"FAIL ({failures})")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
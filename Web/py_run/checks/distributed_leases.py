@@ -0,0 +1,254 @@
+"""
+分布式模式（--distributed）多进程检查：本机启动多个工作进程 + 本地假 API
+
+场景：
+1. claim   —— 3 个进程同时处理视频任务和图片任务：每个工作单元只被完成一次、API 调用数等于网格帧/图片数、
+              合并后的缓存无重复、只有一个进程导出
+2. takeover —— 一个进程持有租约时被 kill -9，剩下的进程等租约过期后接管，
+              复用被杀进程已写入的部分结果，最终完整导出且只导出一次
+3. requeue —— 导出的进程把任务包移入 Backup 并删除租约目录；把同一个任务包（修改时间不变）放回后能再次导出，
+              temp_work 被删而 extract 仍标记为完成时，只由认领到 extract 的一个进程重新解压
+4. interleave —— 进程内构造竞态：B 判定租约过期之后、创建新租约之前，A 抢先接管；B 必须认领失败，
+              原持有者的迟到心跳也不能抢回租约
+
+用法: python checks/distributed_leases.py [--ttl 2] [--timeout 120]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from _fixtures import FakeApi, count_calls, make_task, use_fake_api
+from work_lease import LeaseBoard, _atomic_write_json
+
+EXIT_EXPORTED, EXIT_WORKER_ONLY, EXIT_FAILED = 0, 2, 1
+
+def run_worker(zip_path, worker_id, url, ttl, backup_dir=None):
+    main = use_fake_api(url)
+    runner = main.DistributedRunner(zip_path, worker_id=worker_id, lease_ttl=ttl)
+    ok = runner.run()
+    # 与 main() 相同：导出的进程移走任务包后删除租约目录
+    if ok and runner.exported and backup_dir and main.move_to_backup(zip_path, backup_dir): runner.retire_board()
+    sys.exit(EXIT_FAILED if not ok else (EXIT_EXPORTED if runner.exported else EXIT_WORKER_ONLY))
+
+def start_worker(zip_path, worker_id, url, ttl, log_dir, backup_dir=None):
+    log = open(os.path.join(log_dir, f"{worker_id}.log"), 'w')
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', zip_path, worker_id, url, str(ttl)]
+    if backup_dir: cmd += ['--backup', backup_dir]
+    return subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+
+def zip_board(work_dir, task, zip_path):
+    """与 DistributedRunner 相同的租约目录"""
+    st = os.stat(zip_path)
+    zip_key = hashlib.md5(f"{st.st_size}:{int(st.st_mtime)}".encode('utf-8')).hexdigest()[:12]
+    return os.path.join(work_dir, "Result", f"{task}.leases", zip_key)
+
+def count_in_logs(work_dir, worker_prefix, text):
+    n = 0
+    for path in glob.glob(os.path.join(work_dir, f"{worker_prefix}*.log")):
+        with open(path) as f: n += f.read().count(text)
+    return n
+
+def board_dir(work_dir, task):
+    dirs = glob.glob(os.path.join(work_dir, "Result", f"{task}.leases", "*"))
+    return dirs[0] if dirs else None
+
+def done_markers(work_dir, task):
+    board = board_dir(work_dir, task)
+    out = {}
+    for path in glob.glob(os.path.join(board, "done", "*.json")) if board else []:
+        with open(path) as f: out[os.path.basename(path)[:-5]] = json.load(f)
+    return out
+
+def held_leases(board, worker):
+    """worker 当前持有（未释放）的工作单元"""
+    out = []
+    for path in glob.glob(os.path.join(board, "leases", "*.json")) if board else []:
+        try:
+            with open(path) as f: data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if data.get("worker") == worker and not data.get("released"):
+            out.append(os.path.basename(path).rsplit('.', 2)[0])
+    return out
+
+def merged_duplicates(work_dir, task):
+    """合并后的视频缓存中重复的时间点数量"""
+    dup = 0
+    for path in glob.glob(os.path.join(work_dir, "Result", task, "temp_work", "cache_progress", "*.json")):
+        with open(path) as f: data = json.load(f)
+        times = [round(x['time'], 2) for x in data if isinstance(x, dict) and 'time' in x and not x.get('_checked')]
+        dup += len(times) - len(set(times))
+    return dup
+
+class Check:
+    def __init__(self):
+        self.failures = 0
+
+    def expect(self, cond, msg):
+        print(f"  [{'ok' if cond else 'FAIL'}] {msg}")
+        if not cond: self.failures += 1
+
+def wait_all(procs, timeout):
+    deadline = time.time() + timeout
+    codes = []
+    for p in procs:
+        try:
+            codes.append(p.wait(timeout=max(0.1, deadline - time.time())))
+        except subprocess.TimeoutExpired:
+            p.kill()
+            codes.append(None)
+    return codes
+
+def scenario_claim(check, tmp, api, ttl, timeout):
+    for mode, n_files, expected_calls, cfg in (('video', 2, 30, {"leaseChunkFrames": 4, "parallelCount": 1}), ('image', 24, 24, {"leaseBatch": 2, "parallelCount": 1})):
+        task = f"claim_{mode}"
+        work_dir = os.path.join(tmp, task)
+        os.makedirs(work_dir)
+        zip_path = os.path.join(work_dir, task + ".zip")
+        # 单线程打标，单个进程做完全部工作所需时间明显长于其他进程的启动/等待解压时间
+        make_task(zip_path, mode, n_files, cfg)
+        calls_before = count_calls(api.calls_log)
+        print(f"claim ({mode}): 3 workers")
+        procs = [start_worker(zip_path, f"w{i}", api.url, ttl, work_dir) for i in range(3)]
+        codes = wait_all(procs, timeout)
+        markers = done_markers(work_dir, task)
+        items = {k: v for k, v in markers.items() if k not in ("extract", "export")}
+        check.expect(None not in codes and EXIT_FAILED not in codes, f"all workers finished (exit codes {codes})")
+        check.expect(codes.count(EXIT_EXPORTED) == 1 and "export" in markers, "exactly one worker exported")
+        check.expect(sum(v.get('calls', 0) for v in items.values()) == expected_calls, f"work items account for {expected_calls} API calls")
+        check.expect(count_calls(api.calls_log) - calls_before == expected_calls, f"API received exactly {expected_calls} calls")
+        check.expect(len({v['worker'] for v in items.values()}) > 1, f"work spread across workers ({len(items)} items)")
+        check.expect(merged_duplicates(work_dir, task) == 0, "merged cache has no duplicate frames")
+        labels = len(glob.glob(os.path.join(work_dir, "Result", task, "labels", "*.txt")))
+        check.expect(labels == expected_calls, f"{labels} label files exported")
+
+def scenario_takeover(check, tmp, api, ttl, timeout):
+    task = "takeover"
+    work_dir = os.path.join(tmp, task)
+    os.makedirs(work_dir)
+    zip_path = os.path.join(work_dir, task + ".zip")
+    # 单线程 + 慢 API，保证被杀时正持有一个只做了一半的租约
+    make_task(zip_path, 'video', 2, {"leaseChunkFrames": 8, "parallelCount": 1})
+    calls_before = count_calls(api.calls_log)
+    print("takeover: kill -9 a worker while it holds a lease")
+    victim = start_worker(zip_path, "victim", api.url, ttl, work_dir)
+    held = None
+    deadline = time.time() + timeout
+    while time.time() < deadline and held is None:
+        time.sleep(0.05)
+        board = board_dir(work_dir, task)
+        partial = glob.glob(os.path.join(work_dir, "Result", task, "temp_work", "workers", "victim", "cache_progress", "*.json"))
+        leases = [item for item in held_leases(board, "victim") if item.startswith("vid_")]
+        if partial and leases and done_markers(work_dir, task).keys() - {"extract"}:
+            held = leases[0]
+    victim.send_signal(signal.SIGKILL)
+    victim.wait()
+    check.expect(held is not None, f"victim was killed while holding {held}")
+    killed_at = time.time()
+
+    procs = [start_worker(zip_path, f"s{i}", api.url, ttl, work_dir) for i in range(2)]
+    codes = wait_all(procs, timeout)
+    markers = done_markers(work_dir, task)
+    check.expect(None not in codes and EXIT_FAILED not in codes, f"survivors finished (exit codes {codes})")
+    check.expect(codes.count(EXIT_EXPORTED) == 1 and markers.get("export", {}).get("worker") in ("s0", "s1"), "exactly one survivor exported")
+    taken = markers.get(held, {})
+    check.expect(taken.get("worker") in ("s0", "s1"), f"{held} re-leased by {taken.get('worker')}")
+    # 最后一次心跳最早在被杀前 ttl/3，租约至少还要 2/3 ttl 才会过期
+    check.expect(taken.get("finished", 0) - killed_at >= ttl * 0.6, "takeover happened only after the lease expired")
+    calls = count_calls(api.calls_log) - calls_before
+    # 被杀瞬间可能有 1 个请求已发出但结果未落盘
+    check.expect(30 <= calls <= 31, f"partial results reused, {calls} API calls for 30 grid frames")
+    check.expect(merged_duplicates(work_dir, task) == 0, "merged cache has no duplicate frames")
+    labels = len(glob.glob(os.path.join(work_dir, "Result", task, "labels", "*.txt")))
+    check.expect(labels == 30, f"{labels} label files exported")
+
+def scenario_requeue(check, tmp, api, ttl, timeout):
+    task = "requeue"
+    work_dir = os.path.join(tmp, task)
+    backup_dir = os.path.join(work_dir, "Backup")
+    os.makedirs(backup_dir)
+    zip_path = os.path.join(work_dir, task + ".zip")
+    backup_zip = os.path.join(backup_dir, task + ".zip")
+    output_zip = os.path.join(work_dir, "Result", f"{task}_output.zip")
+    make_task(zip_path, 'video', 1, {"leaseChunkFrames": 4})
+    for round_no in (1, 2):
+        print(f"requeue: round {round_no}")
+        calls_before = count_calls(api.calls_log)
+        procs = [start_worker(zip_path, f"r{round_no}_{i}", api.url, ttl, work_dir, backup_dir) for i in range(2)]
+        codes = wait_all(procs, timeout)
+        check.expect(None not in codes and EXIT_FAILED not in codes and codes.count(EXIT_EXPORTED) == 1, f"exactly one worker exported (exit codes {codes})")
+        check.expect(os.path.exists(backup_zip) and not os.path.exists(zip_path) and os.path.exists(output_zip), "output written and task package moved to Backup")
+        check.expect(board_dir(work_dir, task) is None, "lease board removed after the move")
+        check.expect(count_in_logs(work_dir, f"r{round_no}_", "Extracting task package") == 1, "extracted by exactly one worker")
+        check.expect(count_calls(api.calls_log) - calls_before == 15, f"{count_calls(api.calls_log) - calls_before} API calls for 15 grid frames")
+        if round_no == 2:
+            check.expect(count_in_logs(work_dir, "r2_", "extracting again") >= 1, "stale extract marker reopened")
+            break
+        # 放回同一个任务包（shutil.move 保留修改时间），并制造 "extract 已完成但 temp_work 不在" 的旧租约目录
+        mtime = os.stat(backup_zip).st_mtime
+        shutil.move(backup_zip, zip_path)
+        check.expect(os.stat(zip_path).st_mtime == mtime, "re-queued package keeps its mtime")
+        os.remove(output_zip)
+        shutil.rmtree(os.path.join(work_dir, "Result", task, "temp_work"))
+        stale = LeaseBoard(zip_board(work_dir, task, zip_path), "stale", ttl)
+        stale.try_acquire("extract")
+        stale.complete("extract")
+
+def scenario_interleave(check, tmp, ttl):
+    print("interleave: A takes over between B's expiry check and B's takeover")
+    root = os.path.join(tmp, "interleave")
+    dead, a, b = (LeaseBoard(root, w, ttl) for w in ("dead", "a", "b"))
+    check.expect(dead.try_acquire("item"), "dead worker holds the lease")
+    # 模拟持有者已停止心跳超过 ttl
+    _atomic_write_json(dead._lease_path("item", 0), {"worker": "dead", "heartbeat": time.time() - 2 * ttl, "acquired": time.time() - 2 * ttl})
+    a_got = []
+    b_expired = b._expired
+    def expired_then_race(path):
+        expired = b_expired(path)
+        a_got.append(a.try_acquire("item"))
+        return expired
+    b._expired = expired_then_race
+    b_got = b.try_acquire("item")
+    b._expired = b_expired
+    check.expect(a_got == [True] and not b_got, f"only one takeover succeeds (a={a_got}, b={b_got})")
+    # 原持有者迟到的心跳不能抢回租约
+    dead.renew()
+    check.expect(dead.was_lost("item") and not b.try_acquire("item"), "late heartbeat of the old holder is ignored")
+    a.renew()
+    check.expect(not a.was_lost("item"), "new holder keeps the lease after renewing")
+    # 释放后可以被重新认领，编号不会重复使用
+    a.release("item")
+    check.expect(b.try_acquire("item") and b.held.get("item") == 2, "released lease is re-acquired as a new generation")
+    check.expect(not a.try_acquire("item"), "released holder cannot take it back while it is held")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ttl', type=float, default=2.0)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--worker', nargs=4, metavar=('ZIP', 'ID', 'URL', 'TTL'), help=argparse.SUPPRESS)
+    parser.add_argument('--backup', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        zip_path, worker_id, url, ttl = args.worker
+        return run_worker(zip_path, worker_id, url, float(ttl), args.backup)
+
+    check = Check()
+    with tempfile.TemporaryDirectory() as tmp:
+        api = FakeApi(os.path.join(tmp, "calls.log"), delay=0.05)
+        scenario_interleave(check, tmp, args.ttl)
+        scenario_claim(check, tmp, api, args.ttl, args.timeout)
+        scenario_takeover(check, tmp, api, args.ttl, args.timeout)
+        scenario_requeue(check, tmp, api, args.ttl, args.timeout)
+        api.close()
+    print("PASS" if not check.failures else f"FAIL ({check.failures})")
+    sys.exit(1 if check.failures else 0)
+
+if __name__ == "__main__":
+    main()
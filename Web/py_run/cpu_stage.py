@@ -0,0 +1,162 @@
+"""
+可选的多进程 CPU 阶段：抽帧解码/JPEG 编码、追踪视频绘制/编码放到子进程里执行，网络请求仍留在主进程的线程中
+
+多个视频时每个视频的抽帧（解码 + 写 JPEG）整体交给一个子进程；只有单个视频时无法按视频并行，
+改为主进程解码、帧通过共享内存分发给各子进程编码。
+
+解码出的帧通过 multiprocessing.shared_memory 交给子进程（只做一次内存拷贝，不 pickle 像素数据）。
+子进程中把 OpenCV 内部线程数设为 1，由进程数来控制并行度，避免线程互相争抢。
+子进程用 forkserver（不支持时用 spawn）启动并在构造时全部拉起：主进程里已有解码/预抽帧线程时再 fork
+会把其他线程持有的锁一起复制进子进程，导致子进程卡死、主线程永远等不到结果。
+"""
+import colorsys
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+
+def _init_worker():
+    cv2.setNumThreads(1)
+
+def _ping():
+    return True
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+def label_color(label):
+    h_val = sum(ord(c) for c in label)
+    rgb = colorsys.hls_to_rgb((h_val%360)/360.0, 0.5, 1.0)
+    return (int(rgb[2]*255), int(rgb[1]*255), int(rgb[0]*255))
+
+def draw_box(img, label, box, w, h):
+    """在图上绘制 0-1000 归一化的 [ymin,xmin,ymax,xmax] 框和标签"""
+    c = label_color(label)
+    ymin, xmin, ymax, xmax = box[:4]
+    p1 = (int(xmin/1000*w), int(ymin/1000*h))
+    p2 = (int(xmax/1000*w), int(ymax/1000*h))
+    cv2.rectangle(img, p1, p2, c, 2)
+    cv2.putText(img, label, (p1[0], p1[1]-5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, c, 1)
+
+def read_frames(cap, indices):
+    """按帧号升序读取指定帧：缺失帧密集时顺序 grab() 跳过中间帧（只解码不转换），稀疏时直接 seek"""
+    indices = sorted(indices)
+    if not indices: return
+    span = indices[-1] - indices[0] + 1
+    if len(indices) * 8 < span:
+        for idx in indices:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+            ret, frame = cap.read()
+            if ret: yield idx, frame
+        return
+    wanted = set(indices)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, indices[0])
+    for idx in range(indices[0], indices[-1] + 1):
+        if not cap.grab(): break
+        if idx in wanted:
+            ret, frame = cap.retrieve()
+            if ret: yield idx, frame
+
+def _write_shared_frame(shm_name, shape, dtype, out_path, params):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        ok = cv2.imwrite(out_path, frame, params)
+        del frame
+        return ok
+    finally:
+        shm.close()
+
+def extract_video_frames(src_path, indices, out_paths, params):
+    """子进程任务：在子进程中完成一个视频的解码与 JPEG 写盘，返回写入的帧数"""
+    cap = cv2.VideoCapture(src_path)
+    written = 0
+    try:
+        for idx, frame in read_frames(cap, indices):
+            if cv2.imwrite(out_paths[idx], frame, params): written += 1
+    finally:
+        cap.release()
+    return written
+
+def render_tagged_video(src_path, out_path, times, boxes, label_ids, label_names):
+    """子进程任务：完整解码一个视频，按时间匹配标注绘制后重新编码（times 需已排序）"""
+    cap = cv2.VideoCapture(src_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    vw, vh = int(cap.get(3)), int(cap.get(4))
+    writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (vw, vh))
+    tol = 1.0 / fps
+    f_idx = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret: break
+        t = f_idx / fps
+        lo, hi = np.searchsorted(times, t - tol, 'right'), np.searchsorted(times, t + tol, 'left')
+        for j in range(lo, hi):
+            draw_box(frame, label_names[label_ids[j]], boxes[j].tolist(), vw, vh)
+        writer.write(frame)
+        f_idx += 1
+    cap.release()
+    writer.release()
+    return f_idx
+
+class CpuStage:
+    """进程池 + 共享内存块复用；同时在途的帧数有上限，防止解码速度快于编码时内存暴涨"""
+    def __init__(self, workers, max_inflight=None):
+        self.workers = max(1, int(workers))
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, mp_context=_mp_context())
+        # 预先拉起全部子进程，之后提交任务不会再创建进程
+        for fut in [self.executor.submit(_ping) for _ in range(self.workers)]: fut.result()
+        self.slots = threading.BoundedSemaphore(max_inflight or self.workers * 4)
+        self.free_blocks = queue.SimpleQueue()
+        self.all_blocks = []
+        self.lock = threading.Lock()
+
+    def _acquire_block(self, nbytes):
+        self.slots.acquire()
+        try:
+            while True:
+                block = self.free_blocks.get_nowait()
+                if block.size >= nbytes: return block
+                self._destroy(block)
+        except queue.Empty:
+            pass
+        block = shared_memory.SharedMemory(create=True, size=nbytes)
+        with self.lock: self.all_blocks.append(block)
+        return block
+
+    def _release_block(self, block):
+        self.free_blocks.put(block)
+        self.slots.release()
+
+    def _destroy(self, block):
+        with self.lock:
+            if block in self.all_blocks: self.all_blocks.remove(block)
+        block.close()
+        block.unlink()
+
+    def submit_imwrite(self, frame, out_path, params=()):
+        """把帧拷入共享内存，由子进程编码并写盘；返回 Future"""
+        frame = np.ascontiguousarray(frame)
+        block = self._acquire_block(frame.nbytes)
+        try:
+            np.ndarray(frame.shape, dtype=frame.dtype, buffer=block.buf)[:] = frame
+            future = self.executor.submit(_write_shared_frame, block.name, frame.shape, frame.dtype.str, out_path, list(params))
+        except Exception:
+            self._release_block(block)
+            raise
+        future.add_done_callback(lambda _: self._release_block(block))
+        return future
+
+    def submit(self, fn, *args):
+        return self.executor.submit(fn, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        with self.lock: blocks, self.all_blocks = self.all_blocks, []
+        for block in blocks:
+            block.close()
+            block.unlink()
@@ -12,9 +12,21 @@ import hashlib
 import numpy as np
 import threading
 import tempfile
+import heapq
+import argparse
+import socket
+from collections import OrderedDict
 from datetime import datetime
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from yolo_dataset import hash_split, materialize_file, write_data_yaml
+from shard_writer import ShardWriter, AnnotationTable, sample_meta
+from annotation_store import AnnotationStore, LabelTable
+from cpu_stage import CpuStage, draw_box, extract_video_frames, read_frames, render_tagged_video
+from adaptive_sampling import keyframe_positions, refine_candidates, results_differ, frame_signature
+from tracker_propagation import propagate_video, resolve_tracker_type
+from work_lease import LeaseBoard, merge_image_caches, merge_video_caches
+from media_probe import image_size, open_member, probe_video_file, probe_video_in_zip
 
 # 全局变量
 CONFIGS = {}
@@ -41,19 +53,61 @@ class TimeWindowRateLimiter:
                 wait_time = 60 - (now - self.history[0]) + 0.1
                 if wait_time > 0: time.sleep(wait_time)
 
-def load_config_from_js():
-    """读取 config.js"""
-    global CONFIGS
+# --- 工具类：跨任务共享资源（常驻服务模式下保持连接池/限流器/结果缓存常热） ---
+class SharedResources:
+    """HTTP 连接池、按 API 账号共享的限流器、以及按图片内容去重的结果缓存"""
+    def __init__(self, pool_size=16, max_cached_results=4096):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.max_cached_results = max_cached_results
+        self.limiters = {}
+        self.results = OrderedDict()
+        self.cpu_stage = None
+        self.lock = threading.Lock()
+
+    def get_cpu_stage(self, workers):
+        # 进程池跨任务常驻；以第一次请求的进程数为准
+        with self.lock:
+            if self.cpu_stage is None:
+                self.cpu_stage = CpuStage(workers)
+            return self.cpu_stage
+
+    def get_rate_limiter(self, api_conf, rpm):
+        # 同一个 URL + Key 共用一个限流窗口，避免多个任务叠加后超出账号 RPM
+        key = (api_conf.get('url'), api_conf.get('key'), int(rpm) if rpm else 60)
+        with self.lock:
+            if key not in self.limiters:
+                self.limiters[key] = TimeWindowRateLimiter(rpm)
+            return self.limiters[key]
+
+    def get_result(self, cache_key):
+        with self.lock:
+            if cache_key not in self.results: return None
+            self.results.move_to_end(cache_key)
+            return json.loads(self.results[cache_key])
+
+    def put_result(self, cache_key, result):
+        with self.lock:
+            self.results[cache_key] = json.dumps(result)
+            self.results.move_to_end(cache_key)
+            while len(self.results) > self.max_cached_results:
+                self.results.popitem(last=False)
+
+def find_config_path():
+    """按优先级查找 config.js（上一级目录优先）"""
     current_dir = os.path.dirname(os.path.abspath(__file__))
     parent_dir = os.path.dirname(current_dir)
     paths_to_check = [os.path.join(parent_dir, "config.js"), os.path.join(current_dir, "config.js")]
-    
-    config_path = None
     for p in paths_to_check:
         if os.path.exists(p):
-            config_path = p
-            break
-            
+            return p
+    return None
+
+def load_config_from_js():
+    """读取 config.js（重复调用即热重载，解析失败时保留旧配置）"""
+    config_path = find_config_path()
     if not config_path:
         print(f"[ERROR] Config file not found.")
         return False
@@ -66,6 +120,7 @@ def load_config_from_js():
         main_block = re.search(r'const\s+CONFIGS\s*=\s*\{([\s\S]*?)\};', content)
         if not main_block: return False
 
+        parsed = {}
         block_content = main_block.group(1)
         current_model = None
         lines = block_content.split('\n')
@@ -75,20 +130,56 @@ def load_config_from_js():
             model_match = re.match(r"['\"]?([\w\-\.]+)['\"]?\s*:\s*\{", line)
             if model_match:
                 current_model = model_match.group(1)
-                CONFIGS[current_model] = {}
+                parsed[current_model] = {}
                 continue
             if current_model and ':' in line:
                 val_match = re.match(r"['\"]?(\w+)['\"]?\s*:\s*['\"]([^'\"]+)['\"]", line)
                 if val_match:
                     k, v = val_match.groups()
-                    CONFIGS[current_model][k] = v
+                    parsed[current_model][k] = v
+        CONFIGS.clear()
+        CONFIGS.update(parsed)
         return True
     except Exception as e:
         print(f"[EXCEPTION] Failed to parse config.js: {e}")
         return False
 
+def cache_path_for(cache_dir, file_name):
+    safe_name = hashlib.md5(file_name.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, safe_name + ".json")
+
+# --- API 延迟历史：每次运行结束后按模型记录平均单次调用耗时，供 --plan 估算 ---
+LATENCY_HISTORY_WINDOW = 500  # 滚动平均的最大样本权重，旧数据逐渐被新数据取代
+DEFAULT_LATENCY = 5.0
+
+def latency_history_path(base_dir):
+    return os.path.join(base_dir, "Result", "latency_history.json")
+
+def load_latency_history(base_dir):
+    try:
+        with open(latency_history_path(base_dir), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def record_latency(base_dir, model_key, samples):
+    if not samples: return
+    history = load_latency_history(base_dir)
+    old = history.get(model_key, {})
+    n_old = max(0, min(int(old.get('count', 0)), LATENCY_HISTORY_WINDOW - len(samples)))
+    mean = (old.get('mean', 0.0) * n_old + sum(samples)) / (n_old + len(samples))
+    history[model_key] = {"mean": round(mean, 3), "count": n_old + len(samples), "updated": datetime.now().isoformat(timespec='seconds')}
+    path = latency_history_path(base_dir)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), delete=False, encoding='utf-8') as tf:
+            json.dump(history, tf, indent=2)
+        os.replace(tf.name, path)
+    except Exception as e:
+        print(f"Write latency history failed: {e}")
+
 class AutoTagRunner:
-    def __init__(self, zip_path):
+    def __init__(self, zip_path, shared=None, cpu_workers=None):
         self.zip_path = zip_path
         self.task_name = os.path.splitext(os.path.basename(zip_path))[0]
         self.base_dir = os.path.dirname(os.path.abspath(zip_path))
@@ -103,8 +194,25 @@ class AutoTagRunner:
         self.files_dir = None
         self.unified_class_map = {}
         self.next_class_id = 0
+        self.label_table = LabelTable()
+        self.dense_tracker_type = None
         self.rate_limiter = None 
         self.parallel_count = 3 
+        # 常驻服务模式下由外部传入共享资源；单次运行时各任务独立
+        self.shared = shared
+        self.session = shared.session if shared else requests.Session()
+        self.status = {"task": self.task_name, "stage": "pending", "done": 0, "total": 0}
+        self.api_latencies = []  # 本次运行中成功请求的耗时（秒）
+        # CPU 进程池（可选）：命令行参数优先，否则读取任务包中的 cpuWorkers
+        self.cpu_workers = cpu_workers
+        self.cpu_stage = None
+        self.owns_cpu_stage = False
+
+    def set_stage(self, stage, total=0):
+        self.status.update({"stage": stage, "done": 0, "total": total})
+
+    def advance(self, n=1):
+        self.status["done"] += n
 
     def log(self, msg):
         print(f"[{self.task_name}] {msg}")
@@ -172,12 +280,24 @@ class AutoTagRunner:
             self.config['results'] = []
 
         rpm_setting = self.config.get('apiRpm', 60)
-        self.rate_limiter = TimeWindowRateLimiter(rpm_setting)
+        if self.shared:
+            self.rate_limiter = self.shared.get_rate_limiter(self.select_api_config(), rpm_setting)
+        else:
+            self.rate_limiter = TimeWindowRateLimiter(rpm_setting)
         self.log(f"Rate Limiter: {rpm_setting} RPM")
 
         self.parallel_count = int(self.config.get('parallelCount', 3))
         if self.parallel_count < 1: self.parallel_count = 1
 
+        cpu_workers = self.cpu_workers if self.cpu_workers is not None else int(self.config.get('cpuWorkers', 0))
+        if cpu_workers > 0:
+            if self.shared:
+                self.cpu_stage = self.shared.get_cpu_stage(cpu_workers)
+            else:
+                self.cpu_stage = CpuStage(cpu_workers)
+                self.owns_cpu_stage = True
+            self.log(f"CPU stage: {self.cpu_stage.workers} worker processes")
+
     def get_class_id(self, label):
         if label not in self.unified_class_map:
             self.unified_class_map[label] = self.next_class_id
@@ -227,7 +347,9 @@ class AutoTagRunner:
 
         for attempt in range(3):
             try:
-                resp = requests.post(api_conf['url'], headers=headers, json=payload, timeout=60)
+                t0 = time.time()
+                resp = self.session.post(api_conf['url'], headers=headers, json=payload, timeout=60)
+                if resp.status_code == 200: self.api_latencies.append(time.time() - t0)
                 if resp.status_code == 429:
                     time.sleep(2 * (attempt + 1))
                     continue 
@@ -254,8 +376,7 @@ class AutoTagRunner:
         return []
 
     def _get_cache_path(self, file_name):
-        safe_name = hashlib.md5(file_name.encode('utf-8')).hexdigest()
-        return os.path.join(self.cache_dir, safe_name + ".json")
+        return cache_path_for(self.cache_dir, file_name)
 
     def _load_cache(self, file_name):
         cache_path = self._get_cache_path(file_name)
@@ -323,6 +444,7 @@ class AutoTagRunner:
 
             if files_to_process:
                 self.log(f"Resuming task. {len(files_to_process)} images remaining.")
+                self.set_stage("tagging", len(files_to_process))
                 with ThreadPoolExecutor(max_workers=self.parallel_count) as executor:
                     # 传入 params_label
                     future_to_file = {
@@ -337,6 +459,7 @@ class AutoTagRunner:
                             self.config['results'].append({ "fileName": file_name, "annotations": result_anns })
                         except Exception as e:
                             self.log(f"Error {file_name}: {e}")
+                        self.advance()
             else:
                 self.log("All images processed (Loaded from cache).")
 
@@ -344,39 +467,66 @@ class AutoTagRunner:
             fps_target = float(self.config.get('frameRate', 1.0))
             if fps_target <= 0.1: fps_target = 0.1
             self.log(f"Using extraction Frame Rate: {fps_target} FPS")
+            self.set_stage("tagging", len(all_files))
+
+            # 启用 CPU 进程池时，每个视频的抽帧（解码 + 编码）在一个子进程中进行，与前面视频的 API 打标重叠；
+            # 这里的线程只负责提交并等待结果
+            prefetch = {}
+            prefetch_pool = None
+            if self.cpu_stage and len(all_files) > 1 and self.config.get('samplingMode') != 'adaptive':
+                prefetch_pool = ThreadPoolExecutor(max_workers=min(len(all_files), self.cpu_stage.workers))
+                prefetch = {f: prefetch_pool.submit(self._extract_missing_frames, os.path.join(self.files_dir, f), fps_target, None, True) for f in all_files}
             
-            for file_name in tqdm(all_files, desc="Processing Videos", ascii=True):
-                file_path = os.path.join(self.files_dir, file_name)
-                try:
-                    # 传入 params_label
-                    video_result = self._process_single_video_resumable(file_path, api_conf, params_prompt, params_label, fps_target)
-                    self.config['results'].append(video_result)
-                except Exception as e:
-                    self.log(f"Error processing video {file_name}: {e}")
+            try:
+                for file_name in tqdm(all_files, desc="Processing Videos", ascii=True):
+                    file_path = os.path.join(self.files_dir, file_name)
+                    try:
+                        extracted = prefetch[file_name].result() if file_name in prefetch else None
+                        # 传入 params_label
+                        video_result = self._process_single_video_resumable(file_path, api_conf, params_prompt, params_label, fps_target, extracted)
+                        self.config['results'].append(video_result)
+                    except Exception as e:
+                        self.log(f"Error processing video {file_name}: {e}")
+                    self.advance()
+            finally:
+                if prefetch_pool: prefetch_pool.shutdown(wait=True)
 
     def _process_single_image(self, file_path, api_conf, prompt, label):
         # 统一处理：读取图片 -> 这里处理文件IO -> 转base64 -> 调API
         with open(file_path, "rb") as img_file:
-            b64_data = base64.b64encode(img_file.read()).decode('utf-8')
-        return self.call_api(api_conf, prompt, label, b64_data)
+            img_bytes = img_file.read()
+        if not self.shared:
+            return self.call_api(api_conf, prompt, label, base64.b64encode(img_bytes).decode('utf-8'))
 
-    def _process_single_video_resumable(self, file_path, api_conf, prompt, label, fps_target):
-        file_basename = os.path.basename(file_path)
+        # 常驻模式：相同模型/提示词/图片内容直接复用内存中的结果
+        h = hashlib.md5(img_bytes)
+        h.update(json.dumps([api_conf.get('url'), api_conf.get('model'), prompt, label]).encode('utf-8'))
+        cache_key = h.hexdigest()
+        cached = self.shared.get_result(cache_key)
+        if cached is not None: return cached
+        result = self.call_api(api_conf, prompt, label, base64.b64encode(img_bytes).decode('utf-8'))
+        if result: self.shared.put_result(cache_key, result)
+        return result
+
+    def _extracted_frame_path(self, base_name_no_ext, idx):
+        # 抽帧存储目录: Result/{task_name}/extracted_frames/{video_name}/，文件名带帧号，保证顺序和唯一性
+        return os.path.join(self.result_dir, "extracted_frames", base_name_no_ext, f"{base_name_no_ext}_{idx:09d}.jpg")
 
+    @staticmethod
+    def _is_valid_file(path):
+        return os.path.exists(path) and os.path.getsize(path) > 0
+
+    def _extract_missing_frames(self, file_path, fps_target, only_indices=None, in_worker=False):
+        """阶段 1：检查并补充抽帧，返回 (video_fps, 目标帧号列表, 帧号->图片路径)
+        only_indices 不为 None 时只补充其中的帧（自适应采样按需抽帧）
+        in_worker 时整个视频的解码和写盘都在 CPU 进程池的一个子进程中完成（多视频预抽帧）"""
+        file_basename = os.path.basename(file_path)
         base_name_no_ext = os.path.splitext(file_basename)[0]
         
         # 1. 设定抽帧存储目录: Result/{task_name}/extracted_frames/{video_name}/
         frames_save_dir = os.path.join(self.result_dir, "extracted_frames", base_name_no_ext)
         os.makedirs(frames_save_dir, exist_ok=True)
         
-        # 加载缓存标注
-        current_annotations = self._load_cache(file_basename)
-        processed_times = set()
-        for item in current_annotations:
-            t = item.get('time', -1)
-            # 是否已处理过（只要缓存里有记录，不管有没有检测到物体，都算处理过）
-            if t >= 0: processed_times.add(round(t, 2))
-        
         # 打开视频获取元数据
         cap = cv2.VideoCapture(file_path)
         if not cap.isOpened(): raise Exception("Cannot open video file")
@@ -390,51 +540,77 @@ class AutoTagRunner:
         # 计算所有需要处理的目标帧索引
         target_indices = list(range(0, total_frames, step))
         
-        # --- 阶段 1: 检查并补充抽帧 ---
         missing_tasks = [] 
         # 构建索引到文件路径的映射
         index_to_path = {}
         
+        wanted = None if only_indices is None else set(only_indices)
         for idx in target_indices:
-            # 文件名带帧号，保证顺序和唯一性
-            fname = f"{base_name_no_ext}_{idx:09d}.jpg"
-            fpath = os.path.join(frames_save_dir, fname)
+            fpath = self._extracted_frame_path(base_name_no_ext, idx)
             index_to_path[idx] = fpath
             
             # 检查文件是否存在且有效
-            if not os.path.exists(fpath) or os.path.getsize(fpath) == 0:
+            if (wanted is None or idx in wanted) and not self._is_valid_file(fpath):
                 missing_tasks.append(idx)
         
         if missing_tasks:
             self.log(f"Extracting {len(missing_tasks)} missing frames for {file_basename} ...")
+            jpeg_params = [int(cv2.IMWRITE_JPEG_QUALITY), 90]
+
+            if in_worker and self.cpu_stage:
+                cap.release()
+                self.cpu_stage.submit(extract_video_frames, file_path, missing_tasks,
+                                      {idx: index_to_path[idx] for idx in missing_tasks}, jpeg_params).result()
+                return video_fps, target_indices, index_to_path
             
-            # 执行抽帧任务
-            # 为了避免频繁seek，如果是大量连续缺失，也可以考虑顺序读取优化，
-            # 但为了逻辑简单且支持任意断点，这里遍历缺失列表
+            # 执行抽帧任务（大量连续缺失时顺序 grab，避免每帧都 seek）
+            # 启用 CPU 进程池时，本线程只负责解码，JPEG 编码通过共享内存交给子进程
+            pending = []
             with tqdm(total=len(missing_tasks), desc=f"Extracting {file_basename}", unit="img", leave=False, ascii=True) as pbar:
-                for idx in missing_tasks:
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
-                    ret, frame = cap.read()
-                    if ret:
-                        cv2.imwrite(index_to_path[idx], frame, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
+                for idx, frame in read_frames(cap, missing_tasks):
+                    if self.cpu_stage:
+                        pending.append(self.cpu_stage.submit_imwrite(frame, index_to_path[idx], jpeg_params))
+                    else:
+                        cv2.imwrite(index_to_path[idx], frame, jpeg_params)
                     pbar.update(1)
-        else:
+                for fut in pending: fut.result()
+        elif only_indices is None:
             self.log(f"Frames already extracted for {file_basename}. Skipping extraction.")
             
         cap.release()
+        return video_fps, target_indices, index_to_path
+
+    def _process_single_video_resumable(self, file_path, api_conf, prompt, label, fps_target, extracted=None):
+        file_basename = os.path.basename(file_path)
+        
+        # 加载缓存标注（只要缓存里有记录，不管有没有检测到物体，都算处理过）
+        store = AnnotationStore.from_dicts(self._load_cache(file_basename), self.label_table, 'obj')
+        
+        if self.config.get('samplingMode') == 'adaptive':
+            return self._process_video_adaptive(file_path, api_conf, prompt, label, fps_target, store)
+        
+        # --- 阶段 1: 检查并补充抽帧（可能已由预抽帧线程完成） ---
+        video_fps, target_indices, index_to_path = extracted or self._extract_missing_frames(file_path, fps_target)
         
         # --- 阶段 2: 将已保存的图片送入API分析 ---
+        self._tag_frames(store, file_basename, [(idx / video_fps, index_to_path[idx]) for idx in target_indices], api_conf, prompt, label)
+        
+        store.sort()
+        return {
+            "fileName": file_basename,
+            "annotations": store,
+            "fps": fps_target
+        }
+
+    def _tag_frames(self, store, file_basename, frames, api_conf, prompt, label):
+        """把 [(时间, 图片路径)] 中尚未处理的帧并行送入 API，结果写入 store 并实时落盘缓存"""
         tasks_to_do = [] 
         
-        for idx in target_indices:
-            time_sec = idx / video_fps
-            rounded_time = round(time_sec, 2)
-            
+        for time_sec, fpath in frames:
             # 如果该时间点已经有结果（包括空结果标记），跳过
-            if rounded_time in processed_times:
+            if store.is_processed(time_sec):
                 continue
                 
-            fpath = index_to_path[idx]
             # 确保文件存在（理论上阶段1肯定生成了）
             if os.path.exists(fpath):
                 tasks_to_do.append((time_sec, fpath))
@@ -454,32 +630,74 @@ class AutoTagRunner:
                         try:
                             res = future.result()
                             
-                            # 结果处理：加上时间戳
-                            if res:
-                                for item in res:
-                                    item['time'] = ts
-                                current_annotations.extend(res)
-                            else:
-                                # 标记为已检查（空结果），防止重复跑
-                                current_annotations.append({'time': ts, '_checked': True})
+                            # 结果处理：按时间戳存入（空结果同样记为已处理，防止重复跑）
+                            store.add_result(ts, res, 'obj')
                             
                             # 实时写入缓存
-                            self._atomic_write_cache(file_basename, current_annotations)
+                            self._atomic_write_cache(file_basename, store.to_dicts(include_checked=True))
                             
                         except Exception as e:
                             # 忽略单帧错误，继续
                             print(f"Warning: Processing failed for timestamp {ts}: {e}")
                             pass 
                         pbar.update(1)
-        
-        # 整理结果，移除内部用的 _checked 标记
-        current_annotations.sort(key=lambda x: x.get('time', 0))
-        final_anns = [a for a in current_annotations if not a.get('_checked', False)]
-        
+        return len(tasks_to_do)
+
+    def _process_video_adaptive(self, file_path, api_conf, prompt, label, fps_target, store):
+        """
+        自适应采样：先打稀疏关键帧，再对结果有变化（框数量/标签变化，或匹配框 IoU 低于阈值）的区间二分加密，
+        直到区间达到最小间隔或单视频调用预算用完。每个选中帧仍按时间戳写入缓存，可随时断点续传。
+        """
+        file_basename = os.path.basename(file_path)
+        keyframe_interval = float(self.config.get('adaptiveKeyframeInterval', 2.0))
+        min_interval = float(self.config.get('adaptiveMinInterval', 1.0 / fps_target))
+        iou_threshold = float(self.config.get('adaptiveIouThreshold', 0.5))
+        budget = int(self.config.get('adaptiveCallBudget', 0))  # 0 表示不限
+
+        # 只读取元数据，不抽帧
+        video_fps, grid, index_to_path = self._extract_missing_frames(file_path, fps_target, only_indices=[])
+        key_every = max(1, int(round(keyframe_interval * fps_target)))
+        min_gap = max(1, int(round(min_interval * fps_target)))
+        tol = 0.5 / video_fps
+
+        def _time(p): return grid[p] / video_fps
+
+        def _differ(p, q):
+            la, ba = frame_signature(store, _time(p), tol)
+            lb, bb = frame_signature(store, _time(q), tol)
+            return results_differ(la, ba, lb, bb, iou_threshold)
+
+        # 预算按视频计：之前运行（包括中断后续传）已打标的网格帧同样计入
+        calls = sum(1 for p in range(len(grid)) if store.is_processed(_time(p)))
+        new_calls = 0
+        attempted = set()
+        round_positions = keyframe_positions(len(grid), key_every)
+        while round_positions:
+            todo = [p for p in round_positions if not store.is_processed(_time(p))]
+            if budget: todo = todo[:max(0, budget - calls)]
+            attempted.update(round_positions)
+            if todo:
+                self._extract_missing_frames(file_path, fps_target, only_indices=[grid[p] for p in todo])
+                store.sort()
+                n = self._tag_frames(store, file_basename, [(_time(p), index_to_path[grid[p]]) for p in todo], api_conf, prompt, label)
+                calls += n
+                new_calls += n
+            if budget and calls >= budget:
+                self.log(f"Adaptive call budget ({budget}) reached for {file_basename}.")
+                break
+            # 缓存中已有的网格帧（包括固定模式跑过的）同样参与比较
+            tagged = [p for p in range(len(grid)) if store.is_processed(_time(p))]
+            store.sort()
+            round_positions = refine_candidates(tagged, _differ, min_gap, attempted)
+
+        frame_indices = [idx for idx in grid if store.is_processed(idx / video_fps)]
+        self.log(f"Adaptive sampling: {len(frame_indices)}/{len(grid)} grid frames tagged for {file_basename} ({new_calls} new API calls).")
+        store.sort()
         return {
             "fileName": file_basename,
-            "annotations": final_anns,
-            "fps": fps_target
+            "annotations": store,
+            "fps": fps_target,
+            "frameIndices": frame_indices
         }
 
     def export_results(self):
@@ -500,12 +718,36 @@ class AutoTagRunner:
             if 'source_video' in export_opts: out_dirs['videos'] = os.path.join(self.result_dir, "videos")
             if 'frames' in export_opts: out_dirs['frames'] = os.path.join(self.result_dir, "frames")
             if 'tagged_video' in export_opts: out_dirs['tagged_videos'] = os.path.join(self.result_dir, "tagged_videos")
+            if 'dense_yolo' in export_opts:
+                out_dirs['dense_images'] = os.path.join(self.result_dir, "dense", "images")
+                out_dirs['dense_labels'] = os.path.join(self.result_dir, "dense", "labels")
+
+        # 直接输出 train/val 划分好的 YOLO 数据集，按源文件（同一视频的所有帧）整体划分，避免帧泄露到验证集
+        dataset_dir = None
+        if 'yolo_dataset' in export_opts:
+            dataset_dir = os.path.join(self.result_dir, "dataset")
+            train_ratio = float(self.config.get('datasetTrainRatio', 0.8))
+            dataset_seed = self.config.get('datasetSeed', 0)
+            for sub in ('images', 'labels'):
+                for split in ('train', 'val'): out_dirs[f'ds_{sub}_{split}'] = os.path.join(dataset_dir, sub, split)
+
+        # tar 分片 + 列式标注表：边导出边写入，避免产生海量小文件
+        shard_writer, ann_table = None, None
+        if 'shards' in export_opts:
+            shard_writer = ShardWriter(os.path.join(self.result_dir, "shards"), self.task_name, self.config.get('shardSize', 1000))
+            ann_table = AnnotationTable()
 
         for d in out_dirs.values(): os.makedirs(d, exist_ok=True)
         results = self.config.get('results', [])
+        self.set_stage("exporting", len(results))
         
         def _get_anns(curr_item): return curr_item.get('annotations', [])
 
+        def _dataset_dirs(file_name):
+            if not dataset_dir: return None, None
+            split = hash_split(file_name, dataset_seed, train_ratio)
+            return out_dirs[f'ds_images_{split}'], out_dirs[f'ds_labels_{split}']
+
         if mode == 'image':
             for item in tqdm(results, desc="Exporting Images", ascii=True):
                 file_name = item.get('fileName')
@@ -520,92 +762,206 @@ class AutoTagRunner:
                 if 'source_image' in export_opts: shutil.copy(src_path, os.path.join(out_dirs['images'], file_name))
                 if 'yolo_txt' in export_opts:
                     with open(os.path.join(out_dirs['labels'], base_name + ".txt"), 'w') as f:
-                        for ann in anns:
-                            box = ann.get('box_2d')
-                            if box:
-                                cx, cy = (box[1]+box[3])/2000, (box[0]+box[2])/2000
-                                bw, bh = (box[3]-box[1])/1000, (box[2]-box[0])/1000
-                                f.write(f"{self.get_class_id(ann.get('label','unknown'))} {cx:.6f} {cy:.6f} {bw:.6f} {bh:.6f}\n")
+                        f.write(self.format_yolo_txt(anns, 'unknown'))
+                ds_img_dir, ds_lbl_dir = _dataset_dirs(file_name)
+                if ds_img_dir:
+                    materialize_file(src_path, os.path.join(ds_img_dir, file_name), "hardlink")
+                    with open(os.path.join(ds_lbl_dir, base_name + ".txt"), 'w') as f:
+                        f.write(self.format_yolo_txt(anns, 'unknown'))
+                if shard_writer:
+                    with open(src_path, 'rb') as f: img_bytes = f.read()
+                    ext = os.path.splitext(file_name)[1].lower().lstrip('.') or 'jpg'
+                    shard = shard_writer.write(ShardWriter.make_key(file_name), {
+                        ext: img_bytes, "txt": self.format_yolo_txt(anns, 'unknown'), "json": sample_meta(file_name, 0, 0, anns)})
+                    boxed = [a for a in anns if a.get('box_2d')]
+                    ann_table.add_frame(file_name, 0, 0, [a['box_2d'] for a in boxed],
+                                        [self.get_class_id(a.get('label', 'unknown')) for a in boxed], shard)
                 if 'visualized_image' in export_opts:
                     vis = img.copy()
                     for ann in anns: self.draw_annotation(vis, ann, w, h)
                     cv2.imwrite(os.path.join(out_dirs['visualized'], file_name), vis)
+                self.advance()
 
         elif mode == 'video':
+            render_jobs = []
             for item in tqdm(results, desc="Exporting Videos", ascii=True):
                 file_name = item.get('fileName')
                 src_path = os.path.join(self.files_dir, file_name)
                 if not os.path.exists(src_path): continue
                 base_name = os.path.splitext(file_name)[0]
                 anns = _get_anns(item)
+                if not isinstance(anns, AnnotationStore):
+                    anns = AnnotationStore.from_dicts(anns, self.label_table, 'obj')
                 
                 if 'source_video' in export_opts: shutil.copy(src_path, os.path.join(out_dirs['videos'], file_name))
-                if any(x in export_opts for x in ['frames', 'yolo_txt', 'tagged_video']):
+                ds_img_dir, ds_lbl_dir = _dataset_dirs(file_name)
+                if any(x in export_opts for x in ['frames', 'yolo_txt', 'tagged_video', 'yolo_dataset', 'shards']):
                     cap = cv2.VideoCapture(src_path)
-                    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+                    fps = cap.get(cv2.CAP_PROP_FPS)
+                    if fps <= 0: fps = 25.0
+                    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
                     vw, vh = int(cap.get(3)), int(cap.get(4))
-                    vid_writer = None
-                    if 'tagged_video' in export_opts:
-                        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                        vid_writer = cv2.VideoWriter(os.path.join(out_dirs['tagged_videos'], f"{base_name}_tagged.mp4"), fourcc, fps, (vw, vh))
-                    
-                    f_idx = 0
-                    # 计算抽帧步长，确保与分析时的帧对齐
+                    # 计算抽帧步长，确保与分析时的帧对齐；自适应采样只导出实际打过标的帧
                     export_step = max(1, int(round(fps / item.get('fps', 1.0))))
-                    while True:
-                        ret, frame = cap.read()
-                        if not ret: break
-                        
-                        is_sampled_frame = (f_idx % export_step == 0)
+                    sampled_indices = item.get('frameIndices')
+                    if sampled_indices is None: sampled_indices = range(0, total_frames, export_step)
+                    sampled_set = set(sampled_indices)
+
+                    def export_sampled(f_idx, frame=None, jpg_path=None):
+                        """导出一个采样帧：优先复用打标时抽好的 JPEG（硬链接/读字节），没有时才用解码出的 frame 编码"""
                         curr_sec = f_idx / fps
-                        # 匹配当前帧附近的标注
-                        frame_anns = [a for a in anns if abs(a.get('time', -1) - curr_sec) < (1.0/fps)]
-                        valid_anns = [a for a in frame_anns if 'box_2d' in a]
+                        # 匹配当前帧附近的标注（按时间二分查找，只把命中的几条转换成字典）
+                        valid_anns = anns.to_dicts(anns.near(curr_sec, 1.0/fps))
+                        frame_name = f"{base_name}_{f_idx:05d}"
+                        yolo_txt = self.format_yolo_txt(valid_anns, 'obj')
 
                         # 只要是采样帧，就导出图片（即使没有识别到物体）
-                        if 'frames' in export_opts and is_sampled_frame:
-                            cv2.imwrite(os.path.join(out_dirs['frames'], f"{base_name}_{f_idx:05d}.jpg"), frame)
-                        
+                        if 'frames' in export_opts:
+                            frame_path = os.path.join(out_dirs['frames'], frame_name + ".jpg")
+                            if jpg_path: materialize_file(jpg_path, frame_path, "hardlink")
+                            else: cv2.imwrite(frame_path, frame)
+                            jpg_path = frame_path
+
                         # 只要是采样帧，就导出txt标签（即使内容为空）
-                        if 'yolo_txt' in export_opts and is_sampled_frame:
-                            txt = ""
-                            for ann in valid_anns:
-                                box = ann.get('box_2d')
-                                if box:
-                                    cx, cy = (box[1]+box[3])/2000, (box[0]+box[2])/2000
-                                    bw, bh = (box[3]-box[1])/1000, (box[2]-box[0])/1000
-                                    txt += f"{self.get_class_id(ann.get('label','obj'))} {cx:.6f} {cy:.6f} {bw:.6f} {bh:.6f}\n"
+                        if 'yolo_txt' in export_opts:
                             # 修改文件路径到 out_dirs['labels'] 并始终写入（支持负样本）
-                            with open(os.path.join(out_dirs['labels'], f"{base_name}_{f_idx:05d}.txt"), 'w') as f: f.write(txt)
+                            with open(os.path.join(out_dirs['labels'], frame_name + ".txt"), 'w') as f: f.write(yolo_txt)
+
+                        if ds_img_dir:
+                            ds_img_path = os.path.join(ds_img_dir, frame_name + ".jpg")
+                            # 已经编码过的帧直接硬链接，不再重复编码
+                            if jpg_path: materialize_file(jpg_path, ds_img_path, "hardlink")
+                            else:
+                                cv2.imwrite(ds_img_path, frame)
+                                jpg_path = ds_img_path
+                            with open(os.path.join(ds_lbl_dir, frame_name + ".txt"), 'w') as f: f.write(yolo_txt)
+
+                        if shard_writer:
+                            if jpg_path:
+                                with open(jpg_path, 'rb') as f: jpg_bytes = f.read()
+                            else:
+                                ok, jpg = cv2.imencode('.jpg', frame)
+                                if not ok: return
+                                jpg_bytes = jpg.tobytes()
+                            shard = shard_writer.write(ShardWriter.make_key(file_name, f"{f_idx:09d}"), {
+                                "jpg": jpg_bytes, "txt": yolo_txt, "json": sample_meta(file_name, f_idx, curr_sec, valid_anns)})
+                            ann_table.add_frame(file_name, f_idx, curr_sec, [a.get('box_2d') for a in valid_anns],
+                                                [self.get_class_id(a.get('label', 'obj')) for a in valid_anns], shard)
+                        return valid_anns
 
-                        
-                        if vid_writer:
+                    tagged_path = os.path.join(out_dirs['tagged_videos'], f"{base_name}_tagged.mp4") if 'tagged_video' in export_opts else None
+                    if tagged_path and self.cpu_stage:
+                        # 追踪视频交给子进程完整解码/绘制/编码，本进程只做不需要解码的采样帧导出
+                        anns.sort()
+                        render_jobs.append(self.cpu_stage.submit(render_tagged_video, src_path, tagged_path, anns.times.copy(),
+                                                                 anns.boxes.copy(), anns.label_ids.copy(), list(anns.labels.names)))
+                    if tagged_path and not self.cpu_stage:
+                        # 追踪视频需要每一帧的像素，只能完整解码一遍
+                        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                        vid_writer = cv2.VideoWriter(tagged_path, fourcc, fps, (vw, vh))
+                        f_idx = 0
+                        while True:
+                            ret, frame = cap.read()
+                            if not ret: break
+                            if f_idx in sampled_set:
+                                extracted = self._extracted_frame_path(base_name, f_idx)
+                                valid_anns = export_sampled(f_idx, frame, extracted if self._is_valid_file(extracted) else None) or []
+                            else:
+                                valid_anns = anns.to_dicts(anns.near(f_idx / fps, 1.0/fps))
                             vis = frame.copy()
                             for ann in valid_anns: self.draw_annotation(vis, ann, vw, vh)
                             vid_writer.write(vis)
-                        f_idx += 1
+                            f_idx += 1
+                        vid_writer.release()
+                    else:
+                        # 不需要追踪视频时完全不解码：直接复用 extracted_frames 中已抽好的帧
+                        missing = []
+                        for f_idx in sampled_indices:
+                            extracted = self._extracted_frame_path(base_name, f_idx)
+                            if self._is_valid_file(extracted): export_sampled(f_idx, jpg_path=extracted)
+                            else: missing.append(f_idx)
+                        # 个别缺失的帧才解码，非采样帧只 grab() 不 retrieve()
+                        for f_idx, frame in read_frames(cap, missing):
+                            export_sampled(f_idx, frame)
                     cap.release()
-                    if vid_writer: vid_writer.release()
+                if 'dense_yolo' in export_opts:
+                    self._export_dense(src_path, base_name, anns, out_dirs['dense_images'], out_dirs['dense_labels'])
+                self.advance()
+            for job in render_jobs: job.result()
 
+        class_names = [l for l, _ in sorted(self.unified_class_map.items(), key=lambda x:x[1])]
+        if shard_writer:
+            shard_writer.close()
+            ann_table.save(os.path.join(self.result_dir, "annotations.npz"), class_names)
+            self.log(f"Wrote {shard_writer.total} samples into {len(shard_writer.shard_paths)} shard(s).")
         if 'classes_txt' in export_opts:
             with open(os.path.join(self.result_dir, "classes.txt"), 'w') as f:
-                for l, _ in sorted(self.unified_class_map.items(), key=lambda x:x[1]): f.write(f"{l}\n")
+                for l in class_names: f.write(f"{l}\n")
+        if dataset_dir:
+            with open(os.path.join(dataset_dir, "classes.txt"), 'w') as f:
+                for l in class_names: f.write(f"{l}\n")
+            write_data_yaml(dataset_dir, class_names)
+
+    def _export_dense(self, src_path, base_name, anns, img_dir, lbl_dir):
+        """用本地跟踪器把关键帧（API 打标帧）的框传播到中间帧，按 denseStep 导出高帧率的图片+标签"""
+        if self.dense_tracker_type is None:
+            self.dense_tracker_type = resolve_tracker_type(self.config.get('trackerType', 'KCF'), self.log)
+        cap = cv2.VideoCapture(src_path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if fps <= 0: fps = 25.0
+        cap.release()
+
+        # 每个已处理的时间点都是关键帧（空结果的关键帧会终止跟踪）
+        tol = 0.5 / fps
+        keyframes = {}
+        for t in anns.processed_times:
+            sl = anns.near(t, tol)
+            keyframes[int(round(t * fps))] = [(anns.labels.name(lid), box) for lid, box in zip(anns.label_ids[sl].tolist(), anns.boxes[sl].tolist())]
+
+        pending = {}
+        def _img_path(f_idx):
+            return os.path.join(img_dir, f"{base_name}_{f_idx:05d}.jpg")
+
+        def on_frame(f_idx, frame):
+            if self.cpu_stage: pending[f_idx] = self.cpu_stage.submit_imwrite(frame, _img_path(f_idx))
+            else: cv2.imwrite(_img_path(f_idx), frame)
+
+        def on_drop(f_idx):
+            # 无法与下一关键帧对齐的帧：图片已在解码时写出，等写完后删除
+            fut = pending.pop(f_idx, None)
+            if fut: fut.result()
+            try:
+                os.remove(_img_path(f_idx))
+            except OSError:
+                pass
+
+        def on_labels(f_idx, objs):
+            with open(os.path.join(lbl_dir, f"{base_name}_{f_idx:05d}.txt"), 'w') as f:
+                f.write(self.format_yolo_txt([{'label': l, 'box_2d': b} for l, b in objs], 'obj'))
+
+        count, dropped = propagate_video(src_path, keyframes, on_labels, on_frame, self.dense_tracker_type,
+                                         step=max(1, int(self.config.get('denseStep', 1))),
+                                         tail_frames=int(float(self.config.get('trackerTailSeconds', 0)) * fps),
+                                         on_drop=on_drop)
+        for fut in pending.values(): fut.result()
+        self.log(f"Dense export: {count} frames for {base_name} from {len(keyframes)} keyframes ({self.dense_tracker_type}), "
+                 f"{dropped} unreconciled frames skipped.")
+
+    def format_yolo_txt(self, anns, default_label):
+        """0-1000 归一化的 [ymin,xmin,ymax,xmax] -> YOLO txt 行"""
+        txt = ""
+        for ann in anns:
+            box = ann.get('box_2d')
+            if box:
+                cx, cy = (box[1]+box[3])/2000, (box[0]+box[2])/2000
+                bw, bh = (box[3]-box[1])/1000, (box[2]-box[0])/1000
+                txt += f"{self.get_class_id(ann.get('label', default_label))} {cx:.6f} {cy:.6f} {bw:.6f} {bh:.6f}\n"
+        return txt
 
     def draw_annotation(self, img, ann, w, h):
         box = ann.get('box_2d')
         if not box: return
-
-        label = ann.get('label', 'unknown')
-        h_val = sum(ord(c) for c in label)
-        import colorsys
-        rgb = colorsys.hls_to_rgb((h_val%360)/360.0, 0.5, 1.0)
-        c = (int(rgb[2]*255), int(rgb[1]*255), int(rgb[0]*255))
-        
-        ymin, xmin, ymax, xmax = box
-        p1 = (int(xmin/1000*w), int(ymin/1000*h))
-        p2 = (int(xmax/1000*w), int(ymax/1000*h))
-        cv2.rectangle(img, p1, p2, c, 2)
-        cv2.putText(img, label, (p1[0], p1[1]-5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, c, 1)
+        draw_box(img, ann.get('label', 'unknown'), box, w, h)
 
     def finalize(self):
         final_zip = os.path.join(self.base_dir, "Result", f"{self.task_name}_output.zip")
@@ -619,28 +975,665 @@ class AutoTagRunner:
         
         self.log(f"SUCCESS. Output: {final_zip}")
 
+    def _run_stages(self):
+        self.set_stage("extracting")
+        self.extract_task()
+        self.process_missing_items()
+        record_latency(self.base_dir, self.config.get('model', DEFAULT_MODEL_KEY), self.api_latencies)
+        self.export_results()
+        self.set_stage("finalizing")
+        self.finalize()
+
     def run(self):
         try:
-            self.extract_task()
-            self.process_missing_items()
-            self.export_results()
-            self.finalize()
+            self._run_stages()
+            self.set_stage("done")
             return True
         except Exception as e:
+            self.set_stage("failed")
             self.log(f"FATAL ERROR: {e}")
             import traceback
             traceback.print_exc()
             return False
+        finally:
+            if self.owns_cpu_stage: self.cpu_stage.shutdown()
+
+# --- 分布式模式：多个进程/主机共享同一目录（如 NFS），按租约认领工作单元 ---
+class DistributedRunner(AutoTagRunner):
+    """
+    多个工作进程协作处理同一个任务包：解压、每个工作单元的打标、最终导出都通过租约认领，
+    每个进程只写自己的缓存目录 temp_work/workers/<worker_id>/cache_progress，
+    全部单元完成后由认领到导出的进程把各缓存合并进 cache_progress，再走与单机相同的导出流程。
+
+    工作单元：图片模式为每 leaseBatch 张一组；视频固定采样为每 leaseChunkFrames 个网格帧一段；
+    自适应采样要依据整段视频的结果决定加密位置，以整个视频为一个单元。
+    限速 apiRpm 由每个工作进程各自执行（N 个进程合计最多 N × apiRpm），多进程运行时应按进程数调低。
+    """
+    def __init__(self, zip_path, worker_id=None, lease_ttl=60.0, cpu_workers=None):
+        super().__init__(zip_path, cpu_workers=cpu_workers)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        # 租约目录放在 temp_work 之外（首次解压前可能会清空 temp_work），并按任务包的大小和修改时间区分，
+        # 之后再放入同名的新任务包时不会沿用旧的完成标记；导出并移走任务包后整个目录会被删除（retire_board）
+        st = os.stat(zip_path)
+        zip_key = hashlib.md5(f"{st.st_size}:{int(st.st_mtime)}".encode('utf-8')).hexdigest()[:12]
+        self.board = LeaseBoard(os.path.join(self.base_dir, "Result", f"{self.task_name}.leases", zip_key), self.worker_id, lease_ttl)
+        self.main_cache_dir = self.cache_dir
+        self.own_cache_dir = os.path.join(self.work_dir, "workers", re.sub(r'[^\w.-]', '_', self.worker_id), "cache_progress")
+        self.merged = False
+        self.exported = False
+
+    def log(self, msg):
+        print(f"[{self.task_name}@{self.worker_id}] {msg}")
+
+    def _cache_dirs(self):
+        """自己的缓存优先，其次其他工作进程，最后是单机模式留下的 cache_progress"""
+        others = sorted(d for d in glob.glob(os.path.join(self.work_dir, "workers", "*", "cache_progress"))
+                        if os.path.abspath(d) != os.path.abspath(self.own_cache_dir))
+        return [self.own_cache_dir] + others + [self.main_cache_dir]
+
+    def _load_cache(self, file_name):
+        if self.merged: return super()._load_cache(file_name)
+        lists = []
+        for d in self._cache_dirs():
+            path = cache_path_for(d, file_name)
+            if not os.path.exists(path): continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    lists.append(json.load(f))
+            except Exception:
+                pass
+        if self.config.get('mode', 'image') == 'image': return merge_image_caches(lists)
+        return merge_video_caches(lists)
+
+    def _cached_anywhere(self, file_name):
+        return any(os.path.exists(cache_path_for(d, file_name)) for d in self._cache_dirs())
+
+    def _acquire_or_wait(self, item):
+        """认领到返回 True；他人已完成返回 False；否则等待（持有者死亡后租约过期即可接管）"""
+        while not self.board.is_done(item):
+            if self.board.try_acquire(item): return True
+            time.sleep(1.0)
+        return False
+
+    def _has_task_config(self):
+        return any("task_config.json" in files for _, _, files in os.walk(self.work_dir))
+
+    def extract_task(self):
+        """解压只在 extract 租约下进行（单机流程找不到 task_config.json 时会清空 temp_work 重新解压）；
+        其他进程等解压完成后只读取配置。解压已标记完成但配置不存在（如 temp_work 被清理）时撤销标记重新认领"""
+        while True:
+            if self._acquire_or_wait("extract"):
+                try:
+                    super().extract_task()
+                except Exception:
+                    self.board.release("extract")
+                    raise
+                self.board.complete("extract")
+                break
+            if self._has_task_config():
+                super().extract_task()
+                break
+            if not os.path.isdir(self.board.root):
+                raise Exception("Task already exported by another worker.")
+            self.log("Extraction marked done but task_config.json is missing, extracting again.")
+            self.board.reopen("extract")
+        os.makedirs(self.own_cache_dir, exist_ok=True)
+        self.cache_dir = self.own_cache_dir
+
+    def _work_items(self, all_files, fps_target):
+        """按确定的顺序切分工作单元，保证所有工作进程得到相同的列表"""
+        items = []
+        if self.config.get('mode', 'image') == 'image':
+            batch = max(1, int(self.config.get('leaseBatch', 16)))
+            files = sorted(all_files)
+            for i in range(0, len(files), batch):
+                items.append((f"img_{i // batch:06d}", files[i:i + batch]))
+            return items
+        chunk = max(1, int(self.config.get('leaseChunkFrames', 50)))
+        for file_name in sorted(all_files):
+            key = hashlib.md5(file_name.encode('utf-8')).hexdigest()[:12]
+            if self.config.get('samplingMode') == 'adaptive':
+                items.append((f"vid_{key}", (file_name, None)))
+                continue
+            try:
+                _, grid, _ = self._extract_missing_frames(os.path.join(self.files_dir, file_name), fps_target, only_indices=[])
+            except Exception as e:
+                self.log(f"Error reading video {file_name}: {e}")
+                continue
+            for c in range(0, len(grid), chunk):
+                items.append((f"vid_{key}_{c // chunk:05d}", (file_name, grid[c:c + chunk])))
+        return items
+
+    def _process_item(self, payload, api_conf, prompt, label, fps_target):
+        """处理一个工作单元，返回新发起的 API 调用数"""
+        if self.config.get('mode', 'image') == 'image':
+            todo = [f for f in payload if not self._cached_anywhere(f)]
+            with ThreadPoolExecutor(max_workers=self.parallel_count) as executor:
+                future_to_file = {executor.submit(self._process_single_image, os.path.join(self.files_dir, f), api_conf, prompt, label): f for f in todo}
+                for future in as_completed(future_to_file):
+                    file_name = future_to_file[future]
+                    try:
+                        self._save_cache_simple(file_name, future.result())
+                    except Exception as e:
+                        self.log(f"Error {file_name}: {e}")
+            return len(todo)
+
+        file_name, indices = payload
+        file_path = os.path.join(self.files_dir, file_name)
+        if indices is None:
+            before = len(self.api_latencies)
+            self._process_single_video_resumable(file_path, api_conf, prompt, label, fps_target)
+            return len(self.api_latencies) - before
+        store = AnnotationStore.from_dicts(self._load_cache(file_name), self.label_table, 'obj')
+        video_fps, _, index_to_path = self._extract_missing_frames(file_path, fps_target, only_indices=indices)
+        return self._tag_frames(store, file_name, [(idx / video_fps, index_to_path[idx]) for idx in indices], api_conf, prompt, label)
+
+    def process_missing_items(self):
+        """租约循环：不断认领未完成的单元直到全部完成；认领不到时等待他人完成或租约过期"""
+        all_files = [f for f in os.listdir(self.files_dir) if not f.startswith('.')]
+        api_conf = self.select_api_config()
+        params_prompt = self.config.get('prompt', 'object')
+        params_label = self.config.get('classLabel', params_prompt)
+        fps_target = max(0.1, float(self.config.get('frameRate', 1.0)))
+
+        items = self._work_items(all_files, fps_target)
+        self.log(f"{len(items)} work items, lease TTL {self.board.ttl:g}s.")
+        self.set_stage("tagging", len(items))
+        # 各进程从不同位置开始扫描，减少同时争抢同一个单元
+        offset = int(hashlib.md5(self.worker_id.encode('utf-8')).hexdigest(), 16) % max(1, len(items))
+        order = items[offset:] + items[:offset]
+        claimed = 0
+        while True:
+            pending = [it for it in order if not self.board.is_done(it[0])]
+            self.status["done"] = len(items) - len(pending)
+            if not pending: break
+            progressed = False
+            for item_id, payload in pending:
+                if not self.board.try_acquire(item_id): continue
+                progressed = True
+                claimed += 1
+                info = {}
+                try:
+                    info["calls"] = self._process_item(payload, api_conf, params_prompt, params_label, fps_target)
+                except Exception as e:
+                    # 与单机模式一致：出错的单元记录后跳过，导出前的补漏阶段会再尝试
+                    self.log(f"Error in {item_id}: {e}")
+                    info["error"] = str(e)
+                if self.board.was_lost(item_id):
+                    self.log(f"Lease on {item_id} expired while processing, results kept.")
+                self.board.complete(item_id, info)
+            if not progressed: time.sleep(min(5.0, self.board.ttl / 4))
+        self.log(f"All work items done ({claimed} processed by this worker).")
+
+    def _merge_worker_caches(self):
+        all_files = [f for f in os.listdir(self.files_dir) if not f.startswith('.')]
+        merged = {f: self._load_cache(f) for f in all_files if self._cached_anywhere(f)}
+        self.merged = True
+        self.cache_dir = self.main_cache_dir
+        for file_name, data in merged.items():
+            self._atomic_write_cache(file_name, data)
+        self.log(f"Merged worker caches for {len(merged)} files.")
+
+    def _collect_merged_results(self):
+        """从合并后的缓存构建导出结果
+        图片和固定采样直接走单机流程（结果均已在缓存中，只会为出错遗漏的图片/网格帧补发请求）；
+        自适应采样不重新加密（否则会再花一次预算），只按缓存重建 frameIndices"""
+        if self.config.get('mode', 'image') == 'image' or self.config.get('samplingMode') != 'adaptive':
+            return AutoTagRunner.process_missing_items(self)
+        fps_target = max(0.1, float(self.config.get('frameRate', 1.0)))
+        self.config['results'] = []
+        for file_name in sorted(f for f in os.listdir(self.files_dir) if not f.startswith('.')):
+            try:
+                video_fps, grid, _ = self._extract_missing_frames(os.path.join(self.files_dir, file_name), fps_target, only_indices=[])
+            except Exception as e:
+                self.log(f"Error processing video {file_name}: {e}")
+                continue
+            store = AnnotationStore.from_dicts(self._load_cache(file_name), self.label_table, 'obj')
+            store.sort()
+            frame_indices = [idx for idx in grid if store.is_processed(idx / video_fps)]
+            if not frame_indices: self.log(f"Warning: no tagged frames for {file_name}.")
+            self.config['results'].append({"fileName": file_name, "annotations": store, "fps": fps_target, "frameIndices": frame_indices})
+
+    def _run_stages(self):
+        self.set_stage("extracting")
+        self.extract_task()
+        self.process_missing_items()
+        record_latency(self.base_dir, self.config.get('model', DEFAULT_MODEL_KEY), self.api_latencies)
+        if self.board.is_done("export") or not self.board.try_acquire("export"):
+            self.log("Export handled by another worker.")
+            return
+        self.set_stage("merging")
+        self._merge_worker_caches()
+        self._collect_merged_results()
+        self.export_results()
+        self.set_stage("finalizing")
+        self.finalize()
+        self.board.complete("export")
+        self.exported = True
+
+    def run(self):
+        self.board.start()
+        try:
+            return super().run()
+        finally:
+            self.board.stop()
+
+    def retire_board(self):
+        """任务包移入 Backup 后调用：删除租约目录，之后再放回同一任务包（大小和修改时间相同）会重新处理和导出"""
+        self.board.retire()
+
+# --- 运行前预估（--plan）：只读中央目录和媒体元数据，不解压、不调用 API、不移动任务包 ---
+def estimate_image_tokens(w, h):
+    """按常见视觉模型的切块计费粗略估算：先缩放到 2048 以内、短边 768，再按 512 切块"""
+    if not w or not h: return 765
+    scale = min(1.0, 2048 / max(w, h))
+    w, h = w * scale, h * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return int(np.ceil(w / 512) * np.ceil(h / 512) * 170 + 85)
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}h {m:02d}m {s:02d}s" if h else f"{m}m {s:02d}s"
+
+class TaskPlanner:
+    """单个任务包的预估：帧网格与运行时规则一致，并扣除 cache_progress 中已完成的部分"""
+    JPEG_BYTES_PER_PIXEL = 0.2   # 未抽帧时按 q90 JPEG 的经验值估算单帧大小
+    PROMPT_TOKENS = 200          # 系统提示词 + 输出 JSON 的大致 token 数
+    REQUEST_OVERHEAD = 1500      # 每次请求除图片外的 JSON 字节数
+
+    def __init__(self, zip_path, latency_history=None):
+        self.zip_path = zip_path
+        self.task_name = os.path.splitext(os.path.basename(zip_path))[0]
+        self.base_dir = os.path.dirname(os.path.abspath(zip_path))
+        self.result_dir = os.path.join(self.base_dir, "Result", self.task_name)
+        self.work_dir = os.path.join(self.result_dir, "temp_work")
+        self.cache_dir = os.path.join(self.work_dir, "cache_progress")
+        self.latency_history = latency_history if latency_history is not None else load_latency_history(self.base_dir)
+
+    def _load_store(self, file_name):
+        path = cache_path_for(self.cache_dir, file_name)
+        if not os.path.exists(path): return AnnotationStore()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return AnnotationStore.from_dicts(json.load(f))
+        except Exception:
+            return AnnotationStore()
+
+    def _mean_frame_bytes(self, base_name_no_ext, sample=64):
+        """已抽帧的视频直接用现有 JPEG 的平均大小"""
+        frames_dir = os.path.join(self.result_dir, "extracted_frames", base_name_no_ext)
+        sizes = []
+        try:
+            with os.scandir(frames_dir) as it:
+                for entry in it:
+                    if entry.name.endswith('.jpg'): sizes.append(entry.stat().st_size)
+                    if len(sizes) >= sample: break
+        except OSError:
+            pass
+        return sum(sizes) / len(sizes) if sizes else None
+
+    def _plan_image(self, zf, info, file_name):
+        item = {"file": file_name, "cached": os.path.exists(cache_path_for(self.cache_dir, file_name))}
+        calls = 0 if item["cached"] else 1
+        f = open_member(zf, info)
+        try:
+            size = image_size(f.read(65536))
+        finally:
+            f.close()
+        w, h = size or (0, 0)
+        item.update(width=w, height=h, calls_min=calls, calls_max=calls,
+                    frame_bytes=info.file_size, tokens_per_call=estimate_image_tokens(w, h) + self.PROMPT_TOKENS)
+        return item
+
+    def _plan_video(self, zf, info, file_name, rel_dir):
+        on_disk = os.path.join(self.work_dir, rel_dir, "files", file_name)
+        meta = probe_video_file(on_disk) if os.path.exists(on_disk) else probe_video_in_zip(zf, info)
+        if not meta or not meta['frame_count']:
+            return {"file": file_name, "error": "cannot read video metadata", "calls_min": 0, "calls_max": 0,
+                    "frame_bytes": 0, "tokens_per_call": 0}
+
+        fps_target = max(0.1, float(self.config.get('frameRate', 1.0)))
+        video_fps = meta['fps'] if meta['fps'] > 0 else 25.0
+        step = max(1, int(round(video_fps / fps_target)))
+        grid = range(0, meta['frame_count'], step)
+        store = self._load_store(file_name)
+        pending = [p for p, idx in enumerate(grid) if not store.is_processed(idx / video_fps)]
+
+        calls_min = calls_max = len(pending)
+        if self.config.get('samplingMode') == 'adaptive':
+            key_every = max(1, int(round(float(self.config.get('adaptiveKeyframeInterval', 2.0)) * fps_target)))
+            pending_set = set(pending)
+            calls_min = sum(1 for p in keyframe_positions(len(grid), key_every) if p in pending_set)
+            budget = int(self.config.get('adaptiveCallBudget', 0))
+            if budget:
+                # 与运行时一致：已打标的网格帧占用同一视频的预算
+                remaining = max(0, budget - (len(grid) - len(pending)))
+                calls_min, calls_max = min(calls_min, remaining), min(calls_max, remaining)
+
+        w, h = meta['width'], meta['height']
+        frame_bytes = self._mean_frame_bytes(os.path.splitext(file_name)[0]) or w * h * self.JPEG_BYTES_PER_PIXEL
+        return {"file": file_name, "fps": round(video_fps, 3), "frames": meta['frame_count'], "width": w, "height": h,
+                "grid": len(grid), "cached": len(grid) - len(pending), "calls_min": calls_min, "calls_max": calls_max,
+                "frame_bytes": int(frame_bytes), "tokens_per_call": estimate_image_tokens(w, h) + self.PROMPT_TOKENS}
+
+    def plan(self):
+        t0 = time.time()
+        with zipfile.ZipFile(self.zip_path, 'r') as zf:
+            config_name = next((n for n in zf.namelist() if n.endswith("task_config.json")), None)
+            if not config_name: raise FileNotFoundError("task_config.json missing in task package")
+            with zf.open(config_name) as f:
+                self.config = json.load(f)
+            rel_dir = os.path.dirname(config_name)
+            prefix = (rel_dir + "/" if rel_dir else "") + "files/"
+            members = [i for i in zf.infolist() if i.filename.startswith(prefix) and not i.is_dir()
+                       and "/" not in i.filename[len(prefix):] and not os.path.basename(i.filename).startswith('.')]
+
+            mode = self.config.get('mode', 'image')
+            items = []
+            for info in members:
+                file_name = os.path.basename(info.filename)
+                if mode == 'image': items.append(self._plan_image(zf, info, file_name))
+                else: items.append(self._plan_video(zf, info, file_name, rel_dir))
+
+        model_key = self.config.get('model', DEFAULT_MODEL_KEY)
+        rpm = float(self.config.get('apiRpm', 60))
+        parallel = max(1, int(self.config.get('parallelCount', 3)))
+        latency = float(self.latency_history.get(model_key, {}).get('mean', DEFAULT_LATENCY))
+        calls_per_sec = min(rpm / 60.0, parallel / latency) if rpm > 0 else parallel / latency
+
+        totals = {}
+        for bound in ('min', 'max'):
+            calls = sum(i[f'calls_{bound}'] for i in items)
+            totals[f'calls_{bound}'] = calls
+            totals[f'upload_bytes_{bound}'] = int(sum(i[f'calls_{bound}'] * (i['frame_bytes'] * 4 / 3 + self.REQUEST_OVERHEAD) for i in items))
+            totals[f'tokens_{bound}'] = sum(i[f'calls_{bound}'] * i['tokens_per_call'] for i in items)
+            totals[f'seconds_{bound}'] = round(calls / calls_per_sec, 1)
+        return {
+            "task": self.task_name, "mode": mode, "model": model_key, "files": len(items),
+            "sampling": self.config.get('samplingMode', 'fixed'),
+            "rpm": rpm, "parallel": parallel, "latency": latency,
+            "latency_source": "history" if model_key in self.latency_history else "default",
+            "calls_per_sec": round(calls_per_sec, 3), **totals,
+            "items": items, "plan_seconds": round(time.time() - t0, 3),
+        }
+
+def print_plan(plan):
+    def _range(key, fmt=str):
+        lo, hi = plan[f'{key}_min'], plan[f'{key}_max']
+        return fmt(lo) if lo == hi else f"{fmt(lo)} - {fmt(hi)}"
+
+    cached = sum(i.get('cached', 0) if plan['mode'] == 'video' else int(i.get('cached', False)) for i in plan['items'])
+    errors = [i for i in plan['items'] if i.get('error')]
+    print(f"=== {plan['task']} ({plan['mode']}, {plan['files']} files, model {plan['model']}, sampling {plan['sampling']}) ===")
+    print(f"  API calls      : {_range('calls')}  (already cached: {cached})")
+    print(f"  Upload         : {_range('upload_bytes', lambda b: f'{b / 1024 / 1024:.1f} MB')}")
+    print(f"  Tokens (est.)  : {_range('tokens', lambda t: f'{t / 1000:.1f}k')}")
+    print(f"  Wall time      : {_range('seconds', format_duration)}  "
+          f"({plan['rpm']:g} RPM, {plan['parallel']} parallel, {plan['latency']:.2f}s latency [{plan['latency_source']}] -> {plan['calls_per_sec']:g} calls/s)")
+    for item in errors:
+        print(f"  [WARN] {item['file']}: {item['error']}")
+
+# --- 常驻服务模式：监听目录、优先级队列、热重载配置、状态输出 ---
+class DirectoryWatcher:
+    """监听目录变化：Linux 下使用 inotify，其他平台或初始化失败时退化为定时轮询"""
+    IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x08, 0x80, 0x100
+
+    def __init__(self, path, poll_interval=5.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.fd = None
+        try:
+            import ctypes, ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0 and libc.inotify_add_watch(fd, os.fsencode(path), self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE) >= 0:
+                self.fd = fd
+            elif fd >= 0:
+                os.close(fd)
+        except Exception:
+            self.fd = None
+
+    @property
+    def backend(self):
+        return "inotify" if self.fd is not None else "polling"
+
+    def wait(self):
+        """阻塞到目录有变化或超时（轮询模式下即固定间隔）"""
+        if self.fd is None:
+            time.sleep(self.poll_interval)
+            return
+        import select
+        ready, _, _ = select.select([self.fd], [], [], self.poll_interval)
+        if ready:
+            try:
+                while os.read(self.fd, 65536): pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+class TaskService:
+    """常驻运行：新任务包按优先级排队，复用 SharedResources，config.js 变更后自动重载"""
+    def __init__(self, watch_dir, poll_interval=5.0, settle_seconds=3.0, status_port=None, cpu_workers=None):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.backup_dir = os.path.join(self.watch_dir, "Backup")
+        self.status_path = os.path.join(self.watch_dir, "service_status.json")
+        self.settle_seconds = settle_seconds
+        self.status_port = status_port
+        self.cpu_workers = cpu_workers
+        self.watcher = DirectoryWatcher(self.watch_dir, poll_interval)
+        self.shared = SharedResources()
+
+        self.queue = []          # (-priority, 入队序号, zip_path)
+        self.queued = set()
+        self.failed = {}         # zip_path -> 失败时的 mtime，文件更新后才重试
+        self.seq = 0
+        self.current = None
+        self.current_runner = None
+        self.finished = 0
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+        self.config_mtime = None
+
+    def log(self, msg):
+        print(f"[service] {msg}")
+
+    def _read_priority(self, zip_path):
+        # 只读取中央目录和 task_config.json，不解压整个包
+        try:
+            with zipfile.ZipFile(zip_path, 'r') as zf:
+                for name in zf.namelist():
+                    if name.endswith("task_config.json"):
+                        with zf.open(name) as f:
+                            return int(json.load(f).get('priority', 0))
+        except Exception:
+            pass
+        return 0
+
+    def scan(self):
+        now = time.time()
+        for z in glob.glob(os.path.join(self.watch_dir, "*.zip")):
+            if "Backup" in z or "Result" in z or "_output" in z: continue
+            try:
+                mtime = os.path.getmtime(z)
+            except OSError:
+                continue
+            # 文件仍在写入（拷贝中）时先不入队
+            if now - mtime < self.settle_seconds: continue
+            with self.cond:
+                if z in self.queued or z == self.current: continue
+                if self.failed.get(z) == mtime: continue
+            if not zipfile.is_zipfile(z): continue
+            priority = self._read_priority(z)
+            with self.cond:
+                self.failed.pop(z, None)
+                heapq.heappush(self.queue, (-priority, self.seq, z))
+                self.seq += 1
+                self.queued.add(z)
+                self.log(f"Queued {os.path.basename(z)} (priority {priority})")
+                self.cond.notify()
+
+    def reload_config_if_changed(self):
+        path = find_config_path()
+        if not path: return
+        mtime = os.path.getmtime(path)
+        if mtime != self.config_mtime:
+            if load_config_from_js():
+                self.config_mtime = mtime
+                self.log("config.js (re)loaded.")
+
+    def snapshot(self):
+        with self.cond:
+            return {
+                "updated": datetime.now().isoformat(timespec='seconds'),
+                "watcher": self.watcher.backend,
+                "queue_depth": len(self.queue),
+                "queued": [os.path.basename(z) for _, _, z in sorted(self.queue)],
+                "current": dict(self.current_runner.status) if self.current else None,
+                "finished": self.finished,
+                "failed": [os.path.basename(z) for z in self.failed],
+            }
+
+    def write_status(self):
+        try:
+            with tempfile.NamedTemporaryFile('w', dir=self.watch_dir, delete=False, encoding='utf-8') as tf:
+                json.dump(self.snapshot(), tf, ensure_ascii=False, indent=2)
+            os.replace(tf.name, self.status_path)
+        except Exception as e:
+            print(f"Write status failed: {e}")
+
+    def _start_status_server(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        service = self
+
+        class StatusHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(service.snapshot(), ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args): pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', self.status_port), StatusHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.log(f"Status endpoint: http://127.0.0.1:{self.status_port}/")
+        return server
+
+    def _watch_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                self.scan()
+                self.write_status()
+            except Exception as e:
+                self.log(f"Scan failed: {e}")
+            self.watcher.wait()
+
+    def run_forever(self):
+        os.makedirs(self.backup_dir, exist_ok=True)
+        self.reload_config_if_changed()
+        server = self._start_status_server() if self.status_port else None
+        self.log(f"Watching {self.watch_dir} ({self.watcher.backend}). Ctrl+C to stop.")
+        threading.Thread(target=self._watch_loop, daemon=True).start()
+        try:
+            while True:
+                with self.cond:
+                    while not self.queue:
+                        self.cond.wait(timeout=1.0)
+                    _, _, zip_file = heapq.heappop(self.queue)
+                    self.queued.discard(zip_file)
+                    if not os.path.exists(zip_file): continue
+                    self.current_runner = AutoTagRunner(zip_file, shared=self.shared, cpu_workers=self.cpu_workers)
+                    self.current = zip_file
+
+                self.reload_config_if_changed()
+                print(f"=== Task : {os.path.basename(zip_file)} ===")
+                success = self.current_runner.run()
+                if success:
+                    move_to_backup(zip_file, self.backup_dir)
+                with self.cond:
+                    if not success and os.path.exists(zip_file):
+                        self.failed[zip_file] = os.path.getmtime(zip_file)
+                    self.finished += 1
+                    self.current = None
+                self.write_status()
+        except KeyboardInterrupt:
+            self.log("Stopping...")
+        finally:
+            self.stop_event.set()
+            if server: server.shutdown()
+            if self.shared.cpu_stage: self.shared.cpu_stage.shutdown()
+            self.watcher.close()
+
+def move_to_backup(zip_file, backup_dir):
+    try:
+        dst_path = os.path.join(backup_dir, os.path.basename(zip_file))
+        if os.path.exists(dst_path):
+            os.remove(dst_path)
+        shutil.move(zip_file, dst_path)
+        print(f"[*] Moved source to Backup: {os.path.basename(zip_file)}")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Move/Delete failed: {e}")
+        return False
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="AutoTag 任务包批量运行器")
+    parser.add_argument('--watch', action='store_true', help="常驻服务模式：持续监听目录中的新任务包")
+    parser.add_argument('--dir', default=None, help="任务包目录（默认脚本所在目录）")
+    parser.add_argument('--interval', type=float, default=5.0, help="轮询间隔/最长等待秒数")
+    parser.add_argument('--status-port', type=int, default=None, help="本地状态接口端口（仅监听 127.0.0.1）")
+    parser.add_argument('--plan', action='store_true', help="只做运行前预估（调用次数/上传量/token/耗时），不处理任务")
+    parser.add_argument('--json', action='store_true', help="--plan 时输出 JSON（含逐文件明细）")
+    parser.add_argument('--distributed', action='store_true', help="分布式模式：多个进程/主机共享目录，按租约分配工作，最后由一个进程合并导出")
+    parser.add_argument('--worker-id', default=None, help="分布式模式下的工作进程标识（默认 主机名-进程号）")
+    parser.add_argument('--lease-ttl', type=float, default=60.0, help="租约过期秒数，超过该时间没有心跳的工作单元会被重新分配")
+    parser.add_argument('--cpu-workers', type=int, default=None, help="CPU 进程池大小（抽帧解码编码/追踪视频渲染），覆盖任务包中的 cpuWorkers，0 为关闭")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    script_dir = os.path.abspath(args.dir) if args.dir else os.path.dirname(os.path.abspath(__file__))
+
+    if args.watch:
+        TaskService(script_dir, poll_interval=args.interval, status_port=args.status_port, cpu_workers=args.cpu_workers).run_forever()
+        return
+
+    zips = [z for z in glob.glob(os.path.join(script_dir, "*.zip")) if "Backup" not in z and "Result" not in z and "_output" not in z]
+
+    if args.plan:
+        history = load_latency_history(script_dir)
+        plans = []
+        for zip_file in sorted(zips):
+            try:
+                plans.append(TaskPlanner(zip_file, history).plan())
+            except Exception as e:
+                plans.append({"task": os.path.basename(zip_file), "error": str(e)})
+        if args.json:
+            print(json.dumps(plans, ensure_ascii=False, indent=2))
+            return
+        for plan in plans:
+            if 'error' in plan: print(f"=== {plan['task']} ===\n  [ERROR] {plan['error']}")
+            else: print_plan(plan)
+        ok = [p for p in plans if 'error' not in p]
+        if ok:
+            print(f"\n[*] Total: {sum(p['calls_min'] for p in ok)} - {sum(p['calls_max'] for p in ok)} API calls, "
+                  f"{format_duration(sum(p['seconds_min'] for p in ok))} - {format_duration(sum(p['seconds_max'] for p in ok))} (tasks run sequentially)")
+        return
+
     if not load_config_from_js(): return
-    script_dir = os.path.dirname(os.path.abspath(__file__))
     
     backup_dir = os.path.join(script_dir, "Backup")
     os.makedirs(backup_dir, exist_ok=True)
 
-    zips = [z for z in glob.glob(os.path.join(script_dir, "*.zip")) if "Backup" not in z and "Result" not in z and "_output" not in z]
-    
     if not zips:
         print("[NOTICE] No task packages found.")
         return 
@@ -648,18 +1641,20 @@ def main():
     print(f"\n[*] Found {len(zips)} task(s). Processing...\n")
     for i, zip_file in enumerate(zips):
         print(f"=== Task ({i+1}/{len(zips)}) : {os.path.basename(zip_file)} ===")
-        runner = AutoTagRunner(zip_file)
-        success = runner.run()
+        if args.distributed:
+            try:
+                runner = DistributedRunner(zip_file, worker_id=args.worker_id, lease_ttl=args.lease_ttl, cpu_workers=args.cpu_workers)
+            except FileNotFoundError:
+                continue  # 已被其他工作进程导出并移走
+            # 只有完成导出的工作进程负责移动任务包
+            success = runner.run() and runner.exported
+        else:
+            runner = AutoTagRunner(zip_file, cpu_workers=args.cpu_workers)
+            success = runner.run()
         
         if success:
-            try:
-                dst_path = os.path.join(backup_dir, os.path.basename(zip_file))
-                if os.path.exists(dst_path):
-                    os.remove(dst_path)
-                shutil.move(zip_file, dst_path)
-                print(f"[*] Moved source to Backup: {os.path.basename(zip_file)}")
-            except Exception as e:
-                print(f"[ERROR] Move/Delete failed: {e}")
+            # 分布式模式：任务包移走之后才删除租约目录，避免其他进程看到任务包还在而重新处理
+            if move_to_backup(zip_file, backup_dir) and args.distributed: runner.retire_board()
         print("\n")
 
 if __name__ == "__main__":
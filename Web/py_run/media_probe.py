@@ -0,0 +1,161 @@
+"""
+不解码、不解压整个任务包即可读取媒体元数据（供 --plan 预估使用）
+
+- MP4/MOV：直接在 zip 成员里按 atom 跳读 moov（网页导出的任务包是 STORE 方式，seek 代价很小）
+- 图片：只读文件头解析 JPEG/PNG 尺寸
+- 其他容器：解压到临时文件后用 cv2.VideoCapture 读取元数据（不读帧）
+"""
+import io
+import os
+import struct
+import shutil
+import tempfile
+import zipfile
+import cv2
+
+MP4_EXTENSIONS = {'.mp4', '.mov', '.m4v', '.3gp'}
+
+def _iter_atoms(f, start, end):
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        hdr = f.read(8)
+        if len(hdr) < 8: return
+        size, typ = struct.unpack('>I4s', hdr)
+        hlen = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            hlen = 16
+        elif size == 0:
+            size = end - pos
+        if size < hlen: return
+        yield typ, pos + hlen, pos + size
+        pos += size
+
+def _find(f, start, end, path):
+    for typ, body, stop in _iter_atoms(f, start, end):
+        if typ == path[0]:
+            return (body, stop) if len(path) == 1 else _find(f, body, stop, path[1:])
+    return None
+
+def probe_mp4(f, size, max_moov=64 * 1024 * 1024):
+    """返回 {'fps', 'frame_count', 'width', 'height', 'duration'}，解析失败返回 None"""
+    moov = _find(f, 0, size, [b'moov'])
+    if not moov or moov[1] - moov[0] > max_moov: return None
+    f.seek(moov[0])
+    m = io.BytesIO(f.read(moov[1] - moov[0]))
+    m_end = moov[1] - moov[0]
+
+    for typ, body, stop in _iter_atoms(m, 0, m_end):
+        if typ != b'trak': continue
+        hdlr = _find(m, body, stop, [b'mdia', b'hdlr'])
+        if not hdlr: continue
+        m.seek(hdlr[0] + 8)
+        if m.read(4) != b'vide': continue
+
+        mdhd = _find(m, body, stop, [b'mdia', b'mdhd'])
+        stsz = _find(m, body, stop, [b'mdia', b'minf', b'stbl', b'stsz'])
+        stts = _find(m, body, stop, [b'mdia', b'minf', b'stbl', b'stts'])
+        tkhd = _find(m, body, stop, [b'tkhd'])
+        if not mdhd or not stsz: return None
+        m.seek(mdhd[0])
+        if m.read(1)[0] == 1:
+            m.seek(mdhd[0] + 20)
+            timescale, duration = struct.unpack('>IQ', m.read(12))
+        else:
+            m.seek(mdhd[0] + 12)
+            timescale, duration = struct.unpack('>II', m.read(8))
+        m.seek(stsz[0] + 8)
+        frame_count = struct.unpack('>I', m.read(4))[0]
+        width = height = 0
+        if tkhd:
+            m.seek(tkhd[1] - 8)
+            width, height = (v >> 16 for v in struct.unpack('>II', m.read(8)))
+        seconds = duration / timescale if timescale else 0
+        fps = frame_count / seconds if seconds > 0 else 0
+        if stts and timescale:
+            # 与 OpenCV(FFmpeg) 报告的帧率保持一致：取出现次数最多的帧间隔
+            m.seek(stts[0] + 4)
+            n = struct.unpack('>I', m.read(4))[0]
+            entries = [struct.unpack('>II', m.read(8)) for _ in range(min(n, 4096))]
+            delta = max(entries, key=lambda e: e[0])[1] if entries else 0
+            if delta: fps = timescale / delta
+        return {'fps': fps, 'frame_count': frame_count, 'width': width, 'height': height, 'duration': seconds}
+    return None
+
+def probe_video_file(path):
+    """cv2.VideoCapture 只读元数据，不解码帧"""
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened(): return None
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        return {'fps': fps, 'frame_count': frame_count, 'width': int(cap.get(3)), 'height': int(cap.get(4)),
+                'duration': frame_count / fps if fps > 0 else 0}
+    finally:
+        cap.release()
+
+class _StoredMember:
+    """未压缩 zip 成员的只读窗口：直接在原文件上 seek（ZipExtFile 的 seek 会逐字节读过中间数据）"""
+    def __init__(self, zip_path, info):
+        self.f = open(zip_path, 'rb')
+        self.f.seek(info.header_offset)
+        hdr = self.f.read(30)
+        name_len, extra_len = struct.unpack('<HH', hdr[26:30])
+        self.start = info.header_offset + 30 + name_len + extra_len
+        self.size = info.file_size
+
+    def seek(self, pos):
+        self.f.seek(self.start + pos)
+
+    def read(self, n):
+        remain = self.size - (self.f.tell() - self.start)
+        return self.f.read(max(0, min(n, remain)))
+
+    def close(self):
+        self.f.close()
+
+def open_member(zf, info):
+    """打开 zip 成员用于随机读取：STORE 方式走原文件偏移，否则退回 zf.open"""
+    if info.compress_type == zipfile.ZIP_STORED and zf.filename:
+        return _StoredMember(zf.filename, info)
+    return zf.open(info)
+
+def probe_video_in_zip(zf, info):
+    ext = os.path.splitext(info.filename)[1].lower()
+    if ext in MP4_EXTENSIONS:
+        f = open_member(zf, info)
+        try:
+            meta = probe_mp4(f, info.file_size)
+            if meta: return meta
+        except Exception:
+            pass
+        finally:
+            f.close()
+    # 兜底：解压单个成员到临时文件
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = os.path.join(tmp, "probe" + ext)
+        with zf.open(info) as src, open(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        return probe_video_file(tmp_path)
+
+def image_size(header):
+    """从文件头字节解析 (width, height)，支持 PNG / JPEG，失败返回 None"""
+    if header[:8] == b'\x89PNG\r\n\x1a\n' and len(header) >= 24:
+        return struct.unpack('>II', header[16:24])
+    if header[:2] == b'\xff\xd8':
+        pos = 2
+        while pos + 9 < len(header):
+            if header[pos] != 0xFF:
+                pos += 1
+                continue
+            marker = header[pos + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                pos += 2
+                continue
+            seg_len = struct.unpack('>H', header[pos + 2:pos + 4])[0]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                h, w = struct.unpack('>HH', header[pos + 5:pos + 9])
+                return w, h
+            pos += 2 + seg_len
+    return None
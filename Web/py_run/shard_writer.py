@@ -0,0 +1,124 @@
+"""
+训练友好的导出格式：WebDataset 风格的 tar 分片 + 整个任务的列式标注表 (.npz)
+
+导出过程中逐帧写入，不会在磁盘上留下海量小文件，也不需要在内存里攒下所有图片。
+"""
+import io
+import os
+import json
+import hashlib
+import tarfile
+import time
+from array import array
+import numpy as np
+
+class ShardWriter:
+    """按固定样本数滚动写入 {prefix}-000000.tar, {prefix}-000001.tar ...
+    同一样本的多个文件共享同一个 key（不含 '.'），符合 WebDataset 约定"""
+    def __init__(self, out_dir, prefix, shard_size=1000):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.shard_size = max(1, int(shard_size))
+        self.shard_index = -1
+        self.count_in_shard = 0
+        self.total = 0
+        self.tar = None
+        self.shard_paths = []
+        os.makedirs(out_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(file_name, *parts):
+        """样本 key = 文件名主干 + 完整文件名的短哈希 + 附加部分（如帧号）
+        '.' 映射为 '_' 后 a.jpg/a.png、a.b.jpg/a_b.jpg 会撞名，靠哈希区分"""
+        stem = os.path.splitext(file_name)[0]
+        digest = hashlib.md5(file_name.encode('utf-8')).hexdigest()[:8]
+        return "_".join([stem, digest] + [str(p) for p in parts]).replace('.', '_')
+
+    def _roll(self):
+        if self.tar: self.tar.close()
+        self.shard_index += 1
+        self.count_in_shard = 0
+        path = os.path.join(self.out_dir, f"{self.prefix}-{self.shard_index:06d}.tar")
+        self.shard_paths.append(path)
+        self.tar = tarfile.open(path, 'w')
+
+    def write(self, key, files):
+        """files: {扩展名: bytes 或 str}，返回该样本所在的分片序号"""
+        if self.tar is None or self.count_in_shard >= self.shard_size:
+            self._roll()
+        now = time.time()
+        for ext, data in files.items():
+            if isinstance(data, str): data = data.encode('utf-8')
+            info = tarfile.TarInfo(f"{key}.{ext}")
+            info.size = len(data)
+            info.mtime = now
+            self.tar.addfile(info, io.BytesIO(data))
+        self.count_in_shard += 1
+        self.total += 1
+        return self.shard_index
+
+    def close(self):
+        if self.tar:
+            self.tar.close()
+            self.tar = None
+
+class AnnotationTable:
+    """整个任务的列式标注表：每个导出帧一行 frame_*，每个框一行 box_*（box_frame 指向帧行号）
+    坐标保持 0-1000 归一化的 [ymin, xmin, ymax, xmax]，int16 存储"""
+    def __init__(self):
+        self.videos = []
+        self.video_ids = {}
+        self.frame_video = array('i')
+        self.frame_index = array('i')
+        self.frame_time = array('f')
+        self.frame_shard = array('i')
+        self.box_frame = array('i')
+        self.box_class = array('h')
+        self.boxes = array('h')
+
+    def _video_id(self, name):
+        if name not in self.video_ids:
+            self.video_ids[name] = len(self.videos)
+            self.videos.append(name)
+        return self.video_ids[name]
+
+    def add_frame(self, video_name, frame_idx, time_sec, boxes, class_ids, shard=-1):
+        row = len(self.frame_index)
+        self.frame_video.append(self._video_id(video_name))
+        self.frame_index.append(int(frame_idx))
+        self.frame_time.append(float(time_sec))
+        self.frame_shard.append(int(shard))
+        for box, cid in zip(boxes, class_ids):
+            if not box or len(box) < 4: continue
+            self.box_frame.append(row)
+            self.box_class.append(int(cid))
+            self.boxes.extend(int(round(float(v))) for v in box[:4])
+        return row
+
+    def save(self, path, class_names):
+        box_frame = np.asarray(self.box_frame, dtype=np.int32)
+        frame_video = np.asarray(self.frame_video, dtype=np.int32)
+        frame_index = np.asarray(self.frame_index, dtype=np.int32)
+        frame_time = np.asarray(self.frame_time, dtype=np.float32)
+        np.savez_compressed(
+            path,
+            videos=np.asarray(self.videos, dtype=str),
+            classes=np.asarray(class_names, dtype=str),
+            frame_video=frame_video,
+            frame_index=frame_index,
+            frame_time=frame_time,
+            frame_shard=np.asarray(self.frame_shard, dtype=np.int32),
+            box_frame=box_frame,
+            box_video=frame_video[box_frame],
+            box_frame_index=frame_index[box_frame],
+            box_time=frame_time[box_frame],
+            box_class=np.asarray(self.box_class, dtype=np.int16),
+            boxes=np.asarray(self.boxes, dtype=np.int16).reshape(-1, 4),
+        )
+
+def sample_meta(video_name, frame_idx, time_sec, anns):
+    """样本附带的 json：保留原始 0-1000 坐标和标签名，便于不依赖 classes.txt 使用"""
+    return json.dumps({
+        "source": video_name, "frame": int(frame_idx), "time": round(float(time_sec), 4),
+        "objects": [{"label": a.get('label'), "box_2d": a.get('box_2d')} for a in anns if a.get('box_2d')],
+    }, ensure_ascii=False)
@@ -0,0 +1,144 @@
+"""
+关键帧之间的本地跟踪传播：用 API 打过标的帧初始化 OpenCV 跟踪器（纯 CPU），
+一次顺序解码把框传播到中间帧，到达下一个关键帧时与新的检测结果对齐修正。
+
+对齐规则（只输出能被下一关键帧确认的帧，宁缺毋滥）：
+- 跟踪框与下一关键帧的检测按同标签贪心 IoU 匹配；全部匹配上时，把每个目标的终点误差按时间线性摊回整段（消除漂移）
+- 只要有跟踪丢失/未匹配（目标消失、跟丢），或下一关键帧出现了新目标（中间帧里可能已经可见），
+  整段中间帧都丢弃：不写图片也不写标签，避免训练集中出现漏标或漂移框
+- 最后一个关键帧之后的尾段没有关键帧可对齐，只保留所有目标都仍在跟踪的帧
+KCF / CSRT 需要 opencv-contrib-python；不可用时自动退回主包自带的 MIL。
+"""
+import cv2
+import numpy as np
+from adaptive_sampling import box_iou
+
+def create_tracker(kind):
+    for mod in (cv2, getattr(cv2, 'legacy', None)):
+        factory = getattr(mod, f"Tracker{kind}_create", None) if mod is not None else None
+        if factory: return factory()
+    return None
+
+def resolve_tracker_type(kind, log=print):
+    kind = (kind or 'KCF').upper()
+    if create_tracker(kind) is not None: return kind
+    log(f"Tracker {kind} not available in this OpenCV build (needs opencv-contrib-python), falling back to MIL.")
+    return 'MIL'
+
+def _to_rect(box, w, h):
+    ymin, xmin, ymax, xmax = box[:4]
+    x, y = int(xmin / 1000 * w), int(ymin / 1000 * h)
+    return (x, y, max(1, int(xmax / 1000 * w) - x), max(1, int(ymax / 1000 * h) - y))
+
+def _to_box(rect, w, h):
+    x, y, rw, rh = rect
+    box = np.array([y / h * 1000, x / w * 1000, (y + rh) / h * 1000, (x + rw) / w * 1000], dtype=np.float64)
+    return np.clip(box, 0, 1000)
+
+class _Track:
+    def __init__(self, label, tracker):
+        self.label = label
+        self.tracker = tracker
+        self.boxes = {}  # 帧号 -> 传播得到的框
+        self.lost = False
+
+def propagate_video(src_path, keyframes, on_labels, on_frame=None, tracker_type='KCF', step=1,
+                    tail_frames=0, iou_match=0.5, on_drop=None):
+    """
+    keyframes: {帧号: [(label, [ymin,xmin,ymax,xmax]), ...]}（空列表表示该关键帧没有目标）
+    on_frame(f_idx, frame): 每个要导出的帧解码后立即回调（写图片）
+    on_labels(f_idx, [(label, box)]): 一段关键帧区间对齐完成后按帧回调（写标签）
+    on_drop(f_idx): 该帧无法对齐被丢弃（删除 on_frame 已写出的图片）
+    step: 每隔多少帧导出一次；tail_frames: 最后一个关键帧之后最多继续传播的帧数
+    返回 (导出帧数, 丢弃帧数)
+    """
+    if not keyframes: return 0, 0
+    kf_indices = sorted(keyframes)
+    first_kf, last_kf = kf_indices[0], kf_indices[-1]
+    cap = cv2.VideoCapture(src_path)
+    w, h = int(cap.get(3)), int(cap.get(4))
+    tracks, seg_start, seg_frames = [], None, []
+    exported, dropped = 0, 0
+
+    def _init_tracks(frame, dets):
+        new_tracks = []
+        for label, box in dets:
+            tracker = create_tracker(tracker_type)
+            if tracker is None: continue
+            try:
+                tracker.init(frame, _to_rect(box, w, h))
+            except cv2.error:
+                continue
+            new_tracks.append(_Track(label, tracker))
+        return new_tracks
+
+    def _match(dets, kf_idx):
+        """每个跟踪都与 kf_idx 处的一个检测匹配且没有多余检测时，返回各跟踪的终点误差，否则返回 None"""
+        used, residuals = set(), []
+        for tr in tracks:
+            end_box = tr.boxes.get(kf_idx)
+            if end_box is None: return None
+            best, best_j = iou_match, None
+            for j, (label, box) in enumerate(dets):
+                if j in used or label != tr.label: continue
+                iou = box_iou(end_box, box)
+                if iou >= best: best, best_j = iou, j
+            if best_j is None: return None
+            used.add(best_j)
+            residuals.append(np.asarray(dets[best_j][1][:4], dtype=np.float64) - end_box)
+        return residuals if len(used) == len(dets) else None
+
+    def _flush(kf_idx, dets):
+        """以 kf_idx 处的检测修正 (seg_start, kf_idx) 之间的传播结果并输出；dets 为 None 表示视频结尾无关键帧可对齐
+        返回 (输出帧数, 丢弃帧数)"""
+        if dets is None:
+            keep = {f for f in seg_frames if all(f in tr.boxes for tr in tracks)}
+            residuals = [np.zeros(4)] * len(tracks)
+        else:
+            residuals = _match(dets, kf_idx)
+            keep = set(seg_frames) if residuals is not None else set()
+        span = max(1, kf_idx - seg_start)
+        for f in seg_frames:
+            if f not in keep:
+                if on_drop: on_drop(f)
+                continue
+            objs = []
+            for tr, residual in zip(tracks, residuals):
+                box = np.clip(tr.boxes[f] + residual * (f - seg_start) / span, 0, 1000)
+                objs.append((tr.label, box.round(1).tolist()))
+            on_labels(f, objs)
+        return len(keep), len(seg_frames) - len(keep)
+
+    f_idx = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret: break
+        if f_idx > last_kf + tail_frames: break
+        if f_idx >= first_kf:
+            for tr in tracks:
+                if tr.lost: continue
+                ok, rect = tr.tracker.update(frame)
+                if ok: tr.boxes[f_idx] = _to_box(rect, w, h)
+                else: tr.lost = True
+
+            if f_idx in keyframes:
+                dets = keyframes[f_idx]
+                if seg_start is not None:
+                    kept, lost = _flush(f_idx, dets)
+                    exported += kept
+                    dropped += lost
+                if on_frame: on_frame(f_idx, frame)
+                on_labels(f_idx, [(label, list(box[:4])) for label, box in dets])
+                exported += 1
+                tracks, seg_start, seg_frames = _init_tracks(frame, dets), f_idx, []
+            elif (f_idx - first_kf) % step == 0:
+                if on_frame: on_frame(f_idx, frame)
+                seg_frames.append(f_idx)
+        f_idx += 1
+    cap.release()
+
+    if seg_frames:
+        kept, lost = _flush(f_idx, None)
+        exported += kept
+        dropped += lost
+    return exported, dropped
@@ -0,0 +1,188 @@
+"""
+多进程 / 多主机共享目录（如 NFS）上的租约式任务分配
+
+每个工作单元的租约是 leases/<item>.<gen>.json，编号最大的一份为当前租约：
+- 认领：O_CREAT|O_EXCL 创建下一个编号（首次为 0），只有一个进程能成功
+- 心跳：后台线程每 ttl/3 秒刷新自己持有的租约（临时文件 + os.replace）
+- 过期 / 释放：心跳超过 ttl 秒未更新视为持有者已死；释放时把租约标记为 released。
+  两种情况下接管方都是 O_EXCL 创建 gen+1，接管本身就是一次原子创建，并发接管时只有一个能成功；
+  旧编号的文件保留，编号不会被重复使用
+- 完成：写 done/<item>.json 标记并释放租约，之后任何进程都不会再认领该单元
+- 退役：任务导出并移走后删除整个租约目录；仍在运行的进程发现目录不在时把所有单元视为已完成
+判断过期使用各主机的本地时钟，要求主机之间已做时间同步（NTP）。
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _atomic_write_json(path, data):
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+class LeaseBoard:
+    def __init__(self, root, worker_id, ttl=60.0):
+        self.root = root
+        self.worker_id = worker_id
+        self.ttl = float(ttl)
+        self.lease_dir = os.path.join(root, "leases")
+        self.done_dir = os.path.join(root, "done")
+        os.makedirs(self.lease_dir, exist_ok=True)
+        os.makedirs(self.done_dir, exist_ok=True)
+        self.held = {}
+        self.lost = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _lease_path(self, item, gen):
+        return os.path.join(self.lease_dir, f"{item}.{gen}.json")
+
+    def _done_path(self, item):
+        return os.path.join(self.done_dir, item + ".json")
+
+    def _current_gen(self, item):
+        """当前租约编号，没有租约时返回 -1（编号从 0 连续递增，且文件不会被删除）"""
+        gen = -1
+        while os.path.exists(self._lease_path(item, gen + 1)): gen += 1
+        return gen
+
+    def _payload(self, acquired=None):
+        now = time.time()
+        return {"worker": self.worker_id, "heartbeat": now, "acquired": acquired or now}
+
+    def is_done(self, item):
+        return os.path.exists(self._done_path(item)) or not os.path.isdir(self.root)
+
+    def reopen(self, item):
+        """撤销完成标记，使该单元可以再次被认领"""
+        try:
+            os.remove(self._done_path(item))
+        except FileNotFoundError:
+            pass
+
+    def retire(self):
+        """删除整个租约目录（先改名再删除，其他进程不会看到删了一半的目录）"""
+        tomb = f"{self.root}.retired.{uuid.uuid4().hex}"
+        try:
+            os.rename(self.root, tomb)
+        except OSError:
+            return
+        shutil.rmtree(tomb, ignore_errors=True)
+
+    def _expired(self, path):
+        data = _read_json(path)
+        if data and data.get("released"): return True
+        try:
+            # 刚被 O_EXCL 创建、尚未写完内容时读不到心跳，用文件 mtime 代替
+            heartbeat = data["heartbeat"] if data else os.path.getmtime(path)
+        except OSError:
+            return False
+        return time.time() - heartbeat > self.ttl
+
+    def try_acquire(self, item):
+        """认领一个工作单元，成功返回 True；已完成、被他人持有且未过期时返回 False"""
+        if self.is_done(item): return False
+        gen = self._current_gen(item)
+        if gen >= 0 and not self._expired(self._lease_path(item, gen)): return False
+        try:
+            fd = os.open(self._lease_path(item, gen + 1), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False  # 其他进程抢先认领 / 接管
+        except FileNotFoundError:
+            return False  # 租约目录已被清理（任务已导出）
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._payload(), f)
+        with self.lock:
+            self.held[item] = gen + 1
+            self.lost.discard(item)
+        if self.is_done(item):  # 认领期间被别人完成
+            self.release(item)
+            return False
+        return True
+
+    def _still_owned(self, item, gen):
+        return os.path.exists(self._lease_path(item, gen)) and not os.path.exists(self._lease_path(item, gen + 1))
+
+    def renew(self):
+        """刷新持有的租约；发现已被他人接管的记入 lost"""
+        with self.lock: items = list(self.held.items())
+        for item, gen in items:
+            path = self._lease_path(item, gen)
+            data = _read_json(path)
+            # 已被接管（出现更高编号）或租约目录已被清理
+            if not data or not self._still_owned(item, gen):
+                with self.lock:
+                    if self.held.get(item) == gen:
+                        del self.held[item]
+                        self.lost.add(item)
+                continue
+            # 与接管并发时改写的是已被取代的旧编号文件，不影响新的持有者；
+            # 持锁写入，避免覆盖同时进行的 release 写下的 released 标记
+            with self.lock:
+                if self.held.get(item) != gen: continue
+                try:
+                    _atomic_write_json(path, self._payload(data.get("acquired")))
+                except OSError as e:
+                    print(f"Lease heartbeat failed for {item}: {e}")
+
+    def was_lost(self, item):
+        with self.lock: return item in self.lost
+
+    def complete(self, item, info=None):
+        _atomic_write_json(self._done_path(item), {"worker": self.worker_id, "finished": time.time(), **(info or {})})
+        self.release(item)
+
+    def release(self, item):
+        with self.lock:
+            gen = self.held.pop(item, None)
+            if gen is None or not self._still_owned(item, gen): return
+            try:
+                _atomic_write_json(self._lease_path(item, gen), {"worker": self.worker_id, "released": time.time()})
+            except OSError:
+                pass
+
+    def _heartbeat_loop(self):
+        while not self.stop_event.wait(self.ttl / 3):
+            self.renew()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread: self.thread.join()
+        with self.lock: items = list(self.held)
+        for item in items: self.release(item)
+
+def merge_image_caches(lists):
+    """图片缓存：每个工作进程各自一份，取第一个存在的"""
+    for data in lists:
+        if data is not None: return data
+    return []
+
+def merge_video_caches(lists):
+    """视频缓存按时间点去重：同一时间点（精确到 0.01 秒）只采用第一个处理过它的工作进程的结果"""
+    owner = {}
+    merged = []
+    for n, data in enumerate(lists):
+        for item in data or []:
+            t = item.get('time', -1)
+            if t is None or t < 0: continue
+            key = round(t, 2)
+            if owner.setdefault(key, n) == n: merged.append(item)
+    return merged
@@ -0,0 +1,320 @@
+"""
+YOLO 数据集划分核心逻辑（不依赖 Tk，可在无界面服务器上运行）
+
+BuildYoloData.py 的图形界面与这里的命令行共用同一套扫描/配对/输出规则。
+命令行模式会在 bvn/ 下保存索引，之后每次运行只处理新增或变化的数据对：
+
+    python yolo_dataset.py --source D:/data --target D:/data --ratio 0.8 --mode hardlink
+"""
+import os
+import json
+import shutil
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+INDEX_FILE_NAME = ".autotag_index.json"
+INDEX_VERSION = 1
+
+# 输出方式：界面显示名 -> 内部模式
+MATERIALIZE_MODES = {
+    "复制 (copy)": "copy",
+    "硬链接 (hardlink)": "hardlink",
+    "软链接 (symlink)": "symlink",
+    "写时复制 (reflink)": "reflink",
+    "仅生成 train.txt/val.txt 路径列表": "list",
+}
+
+def _reflink(src, dst):
+    """写时复制克隆 (Linux FICLONE，btrfs/xfs 等支持)，不支持时抛出 OSError"""
+    import fcntl
+    FICLONE = 0x40049409
+    with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+        try:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        except OSError:
+            fd.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+def materialize_file(src, dst, mode):
+    """按指定方式把 src 放到 dst；链接失败（跨盘、文件系统不支持）时退回普通复制"""
+    if os.path.lexists(dst): os.remove(dst)
+    try:
+        if mode == "hardlink": return os.link(src, dst)
+        if mode == "symlink": return os.symlink(os.path.abspath(src), dst)
+        if mode == "reflink": return _reflink(src, dst)
+    except (OSError, ImportError):
+        pass
+    shutil.copy2(src, dst)
+
+def materialize_pairs(pairs, img_d, lbl_d, mode, workers=8, on_done=None):
+    """把 (图片, 标签) 对放入目标目录；真正复制时多线程并行，链接只是元数据操作
+    标签文件很小且常在 bvn 中直接修改，任何模式下都复制独立副本，避免改动回写到源标签"""
+    def _one(pair):
+        img_s, txt_s = Path(pair[0]), Path(pair[1])
+        materialize_file(img_s, img_d / img_s.name, mode)
+        materialize_file(txt_s, lbl_d / txt_s.name, "copy")
+
+    if workers <= 1:
+        for pair in pairs:
+            _one(pair)
+            if on_done: on_done()
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(_one, pairs):
+            if on_done: on_done()
+
+def write_path_list(pairs, list_path):
+    """Ultralytics 风格的路径列表：每行一张图片的绝对路径，标签按 images->labels 规则查找
+    返回不符合该规则（标签不在对应 labels 目录）的数量"""
+    mismatched = 0
+    with open(list_path, "w", encoding="utf-8") as f:
+        for img_s, txt_s in pairs:
+            img_abs = Path(img_s).absolute()
+            f.write(f"{img_abs.as_posix()}\n")
+            parts = list(img_abs.parts)
+            if "images" in parts:
+                i = len(parts) - 1 - parts[::-1].index("images")
+                parts[i] = "labels"
+                expected = Path(*parts).with_suffix(".txt")
+            else:
+                expected = None
+            if expected != Path(txt_s).absolute():
+                mismatched += 1
+    return mismatched
+
+def write_data_yaml(base_dir, class_names, train_ref="images/train", val_ref="images/val"):
+    yaml_path = Path(base_dir) / "data.yaml"
+    names_str = "\n".join([f"  {i}: {n}" for i, n in enumerate(class_names)]) if class_names else "  0: object"
+    yaml_content = f"path: {Path(base_dir).as_posix()}\ntrain: {train_ref}\nval: {val_ref}\n\nnames:\n{names_str}"
+    with open(yaml_path, "w", encoding="utf-8") as f:
+        f.write(yaml_content)
+    return yaml_path
+
+def read_class_names(source_dir, log=print, hint_dirs=()):
+    """读取 classes.txt（兼容多种编码）；先查常见位置，找不到再递归搜索"""
+    candidates = [Path(d) / "classes.txt" for d in (source_dir, *hint_dirs) if d]
+    found = next((p for p in candidates if p.is_file()), None)
+    if found is None:
+        found = next(iter(Path(source_dir).rglob('classes.txt')), None)
+    if found is None: return []
+
+    content = None
+    for enc in ['utf-8', 'gbk', 'gb2312', 'latin1']:
+        try:
+            with open(found, 'r', encoding=enc) as f:
+                content = f.readlines()
+            log(f"📖 成功以 {enc} 编码读取 classes.txt")
+            break
+        except Exception:
+            continue
+    return [line.strip() for line in content if line.strip()] if content else []
+
+def scan_tree(root, accept, skip_dir=None, workers=8):
+    """并行 os.scandir 遍历，返回 [(路径, mtime_ns, size)]（按路径排序）
+    skip_dir 整个子树直接剪枝，不再逐文件检查父目录"""
+    skip = os.path.normcase(os.path.abspath(skip_dir)) if skip_dir else None
+
+    def _scan(d):
+        files, subdirs = [], []
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if os.path.normcase(entry.path) != skip: subdirs.append(entry.path)
+                        elif entry.is_file() and accept(entry.name):
+                            st = entry.stat()
+                            files.append((entry.path, st.st_mtime_ns, st.st_size))
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return files, subdirs
+
+    found = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = {executor.submit(_scan, os.path.abspath(root))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                files, subdirs = fut.result()
+                found.extend(files)
+                pending |= {executor.submit(_scan, d) for d in subdirs}
+    found.sort()
+    return found
+
+def collect_pairs(image_dir, label_dir, forbidden_dir=None, workers=8):
+    """按文件名（不含扩展名）配对图片和标签，跳过输出目录 bvn 以及 classes.txt
+    返回 {stem: {'img': (path, mtime_ns, size), 'txt': (...)}}，只包含完整配对"""
+    def _is_image(name): return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    def _is_label(name): return name.lower().endswith('.txt') and name != 'classes.txt'
+
+    file_map = {}
+    for item in scan_tree(image_dir, _is_image, forbidden_dir, workers):
+        file_map.setdefault(Path(item[0]).stem, {})['img'] = item
+    for item in scan_tree(label_dir, _is_label, forbidden_dir, workers):
+        file_map.setdefault(Path(item[0]).stem, {})['txt'] = item
+    return {stem: paths for stem, paths in file_map.items() if 'img' in paths and 'txt' in paths}
+
+def hash_split(stem, seed, train_ratio):
+    """由 (seed, stem) 决定的稳定划分：同一数据对在任何一次运行中都落在同一集合"""
+    digest = hashlib.md5(f"{seed}:{stem}".encode('utf-8')).digest()
+    return "train" if int.from_bytes(digest[:8], 'big') / 2**64 < train_ratio else "val"
+
+class DatasetIndexer:
+    """增量生成 bvn 数据集：索引记录每个数据对的 mtime/size 和所属划分，只处理变化的部分"""
+    def __init__(self, image_dir, label_dir, target_dir, source_dir=None, train_ratio=0.8, seed=0,
+                 mode="hardlink", workers=8, log=print):
+        self.image_dir = os.path.abspath(image_dir)
+        self.label_dir = os.path.abspath(label_dir)
+        self.source_dir = os.path.abspath(source_dir) if source_dir else os.path.dirname(self.image_dir)
+        self.base_dir = Path(target_dir).absolute() / "bvn"
+        self.index_path = self.base_dir / INDEX_FILE_NAME
+        self.train_ratio = train_ratio
+        self.seed = seed
+        self.mode = mode
+        self.workers = workers
+        self.log = log
+
+    def _settings(self):
+        # 这些参数变化会改变已有的划分/输出形式，需要整体重建
+        return {"version": INDEX_VERSION, "image_dir": self.image_dir, "label_dir": self.label_dir,
+                "ratio": self.train_ratio, "seed": self.seed, "mode": self.mode}
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get("settings") == self._settings(): return index.get("items", {})
+            self.log("⚙️ 划分参数已变化，重新生成整个数据集")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.log(f"⚠️ 索引损坏，重新生成: {e}")
+        return None
+
+    def _save_index(self, items):
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"settings": self._settings(), "items": items}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _split_dirs(self, split):
+        return self.base_dir / "images" / split, self.base_dir / "labels" / split
+
+    def _remove_outputs(self, entry):
+        if self.mode == "list": return
+        img_d, lbl_d = self._split_dirs(entry["split"])
+        for p in (img_d / Path(entry["img"][0]).name, lbl_d / Path(entry["txt"][0]).name):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def run(self, full=False):
+        self.log("🔎 开始扫描指定目录文件...")
+        pairs = collect_pairs(self.image_dir, self.label_dir, self.base_dir, self.workers)
+        if not pairs:
+            self.log("❌ 未找到有效的文件配对。")
+            return None
+
+        items = None if full else self._load_index()
+        if items is None:
+            if self.base_dir.exists(): shutil.rmtree(self.base_dir)
+            items = {}
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+
+        stats = {"new": 0, "changed": 0, "removed": 0, "unchanged": 0}
+        for stem in [s for s in items if s not in pairs]:
+            self._remove_outputs(items.pop(stem))
+            stats["removed"] += 1
+
+        todo = {"train": [], "val": []}
+        for stem, paths in pairs.items():
+            entry = {"img": list(paths['img']), "txt": list(paths['txt'])}
+            old = items.get(stem)
+            if old and old["img"] == entry["img"] and old["txt"] == entry["txt"]:
+                stats["unchanged"] += 1
+                continue
+            if old:
+                # 已有的划分保持不变，只替换文件
+                self._remove_outputs(old)
+                entry["split"] = old["split"]
+                stats["changed"] += 1
+            else:
+                entry["split"] = hash_split(stem, self.seed, self.train_ratio)
+                stats["new"] += 1
+            items[stem] = entry
+            todo[entry["split"]].append((entry["img"][0], entry["txt"][0]))
+
+        if self.mode == "list":
+            # 路径列表很小，直接按索引整体重写
+            mismatched = 0
+            for split in ("train", "val"):
+                split_pairs = [(e["img"][0], e["txt"][0]) for e in items.values() if e["split"] == split]
+                mismatched += write_path_list(split_pairs, self.base_dir / f"{split}.txt")
+            if mismatched:
+                self.log(f"⚠️ 有 {mismatched} 个标签不在与图片对应的 labels 目录中，Ultralytics 将找不到它们，请改用链接模式。")
+            train_ref, val_ref = "train.txt", "val.txt"
+        else:
+            workers = self.workers if self.mode in ("copy", "reflink") else 1
+            for split in ("train", "val"):
+                img_d, lbl_d = self._split_dirs(split)
+                img_d.mkdir(parents=True, exist_ok=True)
+                lbl_d.mkdir(parents=True, exist_ok=True)
+                materialize_pairs(todo[split], img_d, lbl_d, self.mode, workers)
+            train_ref, val_ref = "images/train", "images/val"
+
+        class_names = read_class_names(self.source_dir, self.log, (self.label_dir, self.image_dir))
+        write_data_yaml(self.base_dir, class_names, train_ref, val_ref)
+        self._save_index(items)
+
+        stats["train"] = sum(1 for e in items.values() if e["split"] == "train")
+        stats["val"] = len(items) - stats["train"]
+        self.log(f"✨ 完成: 新增 {stats['new']} / 变化 {stats['changed']} / 删除 {stats['removed']} / 未变 {stats['unchanged']}，"
+                 f"训练集 {stats['train']} / 验证集 {stats['val']}")
+        return stats
+
+def guess_sub_dirs(source_dir):
+    """与界面中选择数据根目录时相同的规则：自动识别 images/labels 子目录"""
+    image_dir = label_dir = None
+    for item in os.listdir(source_dir):
+        full_item = os.path.join(source_dir, item)
+        if os.path.isdir(full_item):
+            if item.lower() in ["images", "image", "frames", "frame"]:
+                image_dir = full_item
+            elif item.lower() in ["labels", "label"]:
+                label_dir = full_item
+    return image_dir, label_dir
+
+def main():
+    parser = argparse.ArgumentParser(description="YOLO 数据集增量划分（无界面版）")
+    parser.add_argument('--source', required=True, help="数据根目录")
+    parser.add_argument('--images', default=None, help="图片文件夹（默认自动识别）")
+    parser.add_argument('--labels', default=None, help="标签文件夹（默认自动识别）")
+    parser.add_argument('--target', default=None, help="保存位置（默认与数据根目录相同）")
+    parser.add_argument('--ratio', type=float, default=0.8, help="训练集比例 (0-1)")
+    parser.add_argument('--seed', type=int, default=0, help="划分哈希种子")
+    parser.add_argument('--mode', default="hardlink", choices=sorted(set(MATERIALIZE_MODES.values())))
+    parser.add_argument('--workers', type=int, default=8, help="扫描/复制线程数")
+    parser.add_argument('--full', action='store_true', help="忽略索引，完整重建")
+    args = parser.parse_args()
+
+    guessed_images, guessed_labels = guess_sub_dirs(args.source)
+    image_dir = args.images or guessed_images
+    label_dir = args.labels or guessed_labels
+    if not image_dir or not label_dir:
+        parser.error("无法识别图片/标签文件夹，请使用 --images / --labels 指定")
+
+    indexer = DatasetIndexer(image_dir, label_dir, args.target or args.source, source_dir=args.source,
+                             train_ratio=args.ratio, seed=args.seed, mode=args.mode, workers=args.workers)
+    if indexer.run(full=args.full) is None:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()